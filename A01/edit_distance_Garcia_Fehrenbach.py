@@ -1,54 +1,383 @@
-import sys
+import argparse
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import fasta_Garcia_Fehrenbach as f
 import numpy as np
 import pandas as pd
 
 """Task 05"""
-""" variables """
-inPath = sys.argv[1]
-header = []
-seq = []
-
-""" read file """
-data = f.read(inPath)
-for i in range(len(data)):
-    header.append(data[i][0])
-    seq.append(data[i][1])
-
-def calc_edit_dist(header, seq):
+
+BLOCK_CELLS = 1 << 24 # max. number of compared chars per broadcasting block
+TILE_SIZE = 2048 # rows per tile of the out-of-core matrix
+BATCH_PAIRS = 4096 # pairs per levenshtein_batch call
+CHECK_COLUMNS = 32 # levenshtein_batch with threshold: columns between two lower bound checks
+
+
+def encode(seqs):
+    """ encodes sequences of equal length as rows of a uint8 matrix
+        :returns: matrix of shape (number of sequences, sequence length)"""
+    length = len(seqs[0]) if seqs else 0
+    return np.frombuffer("".join(seqs).encode("latin-1"), dtype=np.uint8).reshape(len(seqs), length)
+
+
+def levenshtein(s, t, k=None):
+    """ calculates the edit distance (substitutions, insertions, deletions) of s and t
+        with the bit-vector algorithm of Myers / Hyyroe: one column of the DP matrix is stored as bits
+        of Python ints (any length), each char of the longer sequence updates the whole column at once
+        :param k: optional threshold, stop as soon as the distance is known to exceed k
+        :returns: edit distance, or k + 1 if it is larger than k"""
+    if len(s) > len(t): # pattern = shorter sequence -> fewer bits
+        s, t = t, s
+    m, n = len(s), len(t)
+    if k is not None and n - m > k:
+        return k + 1
+    if m == 0:
+        return n
+    peq = {} # bit mask of the positions of each char in s
+    for i, c in enumerate(s):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    vp, vn = mask, 0 # vertical deltas +1 / -1 of the current column
+    score = m
+    for j, c in enumerate(t):
+        eq = peq.get(c, 0)
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        ph = vn | ~(xh | vp) # horizontal deltas +1 / -1
+        mh = vp & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        if k is not None and score - (n - j - 1) > k: # score drops by at most 1 per remaining column
+            return k + 1
+        ph = ((ph << 1) | 1) & mask # global alignment -> top row increases by 1 per column
+        mh = (mh << 1) & mask
+        vp = (mh | ~(xv | ph)) & mask
+        vn = ph & xv
+    return score if k is None or score <= k else k + 1
+
+
+POPCOUNT = np.array([bin(b).count("1") for b in range(256)], dtype=np.int32) # set bits of a byte
+
+
+def column_bound(vp, vn, m, n, j, k):
+    """ lower bound of the edit distance of every lane after j columns of levenshtein_batch:
+        min over the rows i of D(i, j) + |(m - i) - (n - j)|, the rest of the path needs at least that many
+        insertions or deletions, D(i, j) = j + sum of the vertical deltas of the rows <= i.
+        Only the rows |i - j| <= k are unpacked, the others have D(i, j) >= |i - j| > k anyway.
+        :returns: int array, values > k are not exact"""
+    lo, hi = max(0, j - k), min(vp.shape[0] * 64, j + k) # rows lo..hi
+    w0, w1 = lo // 64, hi // 64 + 1 # words holding the deltas of rows lo + 1..hi
+    bytes_of = lambda v, a, b: v[a:b].T.copy().view(np.uint8)
+    # D(64 * w0, j) from the set bits of the words below
+    base = j + POPCOUNT[bytes_of(vp, 0, w0)].sum(axis=1) - POPCOUNT[bytes_of(vn, 0, w0)].sum(axis=1)
+    unpack = lambda v: np.unpackbits(bytes_of(v, w0, w1), axis=1, bitorder="little")
+    d = np.cumsum(unpack(vp).astype(np.int32) - unpack(vn), axis=1, dtype=np.int32)
+    d = np.concatenate((np.zeros((d.shape[0], 1), np.int32), d), axis=1) + base[:, None]
+    rows = np.arange(64 * w0, 64 * w0 + d.shape[1])
+    inside = (rows >= lo) & (rows <= hi) & (rows <= m[:, None])
+    cost = np.where(inside, d + np.abs(m[:, None] - rows - (n[:, None] - j)), k + 1)
+    return cost.min(axis=1)
+
+
+def levenshtein_batch(pairs, k=None):
+    """ calculates the edit distance of many pairs at once with the bit-vector algorithm:
+        every pair is one lane of NumPy uint64 arrays, the column bit-vector of each pair is split into
+        64 bit words (additions and shifts carry across words) -> one NumPy operation updates all pairs
+        :param pairs: list of tuples (s, t) of str or bytes
+        :param k: optional threshold, distances > k are reported as k + 1: pairs whose lengths differ by more than
+        k are not computed, every CHECK_COLUMNS columns the lanes whose column_bound exceeds k or that are
+        finished are dropped, the loop stops when no lane is left
+        :returns: int array of edit distances"""
+    if len(pairs) > BATCH_PAIRS:
+        return np.concatenate([levenshtein_batch(pairs[i:i + BATCH_PAIRS], k)
+                               for i in range(0, len(pairs), BATCH_PAIRS)])
+    # pattern = shorter sequence of each pair
+    pairs = [(s, t) if len(s) <= len(t) else (t, s) for s, t in pairs]
+    size = len(pairs)
+    m = np.array([len(s) for s, t in pairs], dtype=np.int64)
+    n = np.array([len(t) for s, t in pairs], dtype=np.int64)
+    if size == 0 or m.max() == 0:
+        return n if k is None else np.minimum(n, k + 1)
+    words = int(m.max() + 63) // 64
+    # chars of both sequences as byte codes, padding 0 never matches (no sequence contains a NUL byte)
+    pattern = np.zeros((size, int(m.max())), dtype=np.uint8)
+    text = np.zeros((size, int(n.max())), dtype=np.uint8)
+    for p, (s, t) in enumerate(pairs):
+        pattern[p, :len(s)] = np.frombuffer(s.encode("latin-1") if isinstance(s, str) else s, dtype=np.uint8)
+        text[p, :len(t)] = np.frombuffer(t.encode("latin-1") if isinstance(t, str) else t, dtype=np.uint8)
+    # map the chars of all pairs to a small alphabet, code 0 stays padding
+    present = np.zeros(256, dtype=bool)
+    present[0] = present[pattern] = present[text] = True
+    alphabet = np.flatnonzero(present)
+    code = np.cumsum(present) - 1 # byte -> index into the alphabet
+    pattern_codes, text = code[pattern], code[text]
+    # peq[w, p * A + c] = word w of the bit mask of the positions of char c in the pattern of pair p
+    size_a = len(alphabet)
+    peq = np.zeros((words, size * size_a), dtype=np.uint64)
+    p_idx, pos = np.nonzero(np.arange(pattern.shape[1])[None, :] < m[:, None])
+    np.bitwise_or.at(peq, (pos // 64, p_idx * size_a + pattern_codes[p_idx, pos]),
+                     np.uint64(1) << (pos % 64).astype(np.uint64))
+    peq[:, ::size_a] = 0 # padding
+    column_idx = (text + np.arange(size)[:, None] * size_a).T.copy() # column j -> index into peq for all pairs
+    one, shift = np.uint64(1), np.uint64(63)
+    # mask of the valid bits of each pattern, position of its highest bit
+    bits = np.clip(m[None, :] - 64 * np.arange(words)[:, None], 0, 64).astype(np.uint64)
+    mask = np.where(bits == 64, np.uint64(0xFFFFFFFFFFFFFFFF), (one << np.minimum(bits, shift)) - one)
+    high_word = np.maximum(m - 1, 0) // 64
+    high_bit = one << (np.maximum(m - 1, 0) % 64).astype(np.uint64)
+    vp, vn = mask.copy(), np.zeros_like(mask) # vertical deltas +1 / -1 of the current columns
+    score = m.copy()
+    result = np.where(m == 0, n, k + 1 if k is not None else 0)
+    alive = np.arange(size) # original index of the lanes that are still computed
+    keep = np.flatnonzero(m > 0) if k is None else np.flatnonzero((m > 0) & (n - m <= k))
+    interval = CHECK_COLUMNS if k is None else min(CHECK_COLUMNS, 2 * (k + 1)) # a bound > k needs > k columns
+    check = interval
+    for j in range(text.shape[1]):
+        if k is not None and j == check:
+            done = j >= n
+            result[alive[done]] = score[done]
+            bound = column_bound(vp, vn, m, n, j, k)
+            keep = np.flatnonzero(~done & (bound <= k))
+            if 4 * np.count_nonzero(~done & (bound > k)) < len(alive): # few lanes dropped -> check less often
+                interval *= 2
+            check += interval
+        if len(keep) < len(alive): # drop the finished lanes
+            alive = alive[keep]
+            vp, vn, mask, column_idx = (np.ascontiguousarray(v[:, keep]) for v in (vp, vn, mask, column_idx))
+            m, n, score, high_word, high_bit = m[keep], n[keep], score[keep], high_word[keep], high_bit[keep]
+            keep = np.arange(len(alive))
+        if len(alive) == 0:
+            break
+        lanes = np.arange(len(alive))
+        eq = peq[:, column_idx[j]]
+        xv = eq | vn
+        a = eq & vp
+        total = a + vp # a + vp over all words with carry
+        carry = total < a
+        for w in range(1, words):
+            total[w] += carry[w - 1]
+            carry[w] |= carry[w - 1] & (total[w] == 0)
+        xh = (total ^ vp) | eq
+        ph = vn | ~(xh | vp) # horizontal deltas +1 / -1
+        mh = vp & xh
+        active = j < n
+        score += active & ((ph[high_word, lanes] & high_bit) != 0)
+        score -= active & ((mh[high_word, lanes] & high_bit) != 0)
+        # shift left by one bit across words, global alignment -> top row increases -> carry in 1 for ph
+        ph_shift = ph << one
+        ph_shift[1:] |= ph[:-1] >> shift
+        ph_shift[0] |= one
+        mh_shift = mh << one
+        mh_shift[1:] |= mh[:-1] >> shift
+        ph = ph_shift & mask
+        vp = (mh_shift | ~(xv | ph)) & mask
+        vn = ph & xv
+    result[alive] = score
+    return result if k is None else np.minimum(result, k + 1)
+
+
+def hamming_block(a, b, block_cells=BLOCK_CELLS):
+    """ calculates d(s, t) for all rows s of a and t of b by broadcasting in blocks of rows
+        :returns: matrix of shape (len(a), len(b))"""
+    length = a.shape[1]
+    block = max(1, int(np.sqrt(block_cells / max(length, 1)))) # rows per block
+    dist = np.zeros((len(a), len(b)), int)
+    for i in range(0, len(a), block):
+        for j in range(0, len(b), block):
+            dist[i:i + block, j:j + block] = np.count_nonzero(
+                a[i:i + block, None, :] != b[None, j:j + block, :], axis=2)
+    return dist
+
+
+def hamming_matrix(codes, block_cells=BLOCK_CELLS):
+    """ calculates d(s, t) = # of positions where s, t differ for all rows of an encoded matrix
+        only blocks of the upper triangle are compared by broadcasting, the lower triangle is mirrored
+        :returns: symmetric matrix with all distances"""
+    n, length = codes.shape
+    dist = np.zeros((n, n), int)
+    block = max(1, int(np.sqrt(block_cells / max(length, 1)))) # rows per block
+    for i in range(0, n, block):
+        for j in range(i, n, block):
+            dist[i:i + block, j:j + block] = hamming_block(codes[i:i + block], codes[j:j + block], block_cells)
+    dist = np.triu(dist)
+    return dist + dist.T
+
+
+def calc_edit_dist(header, seq, levenshtein_only=False, k=None):
     """ calculate the edit distance d(s, t) with d(s, t) = # of positions where s, t differ from each other
-        when both sequences are not of the same length, those sequences will be skipped
+        sequences are grouped by length, each group is encoded and compared at once
+        when both sequences are not of the same length, d(s, t) is the Levenshtein distance
+        :param levenshtein_only: if True the Levenshtein distance is used for all pairs
+        :param k: optional threshold, distances > k are reported as k + 1
         :returns: matrix with calculated edit distances"""
-    result = []
-    matrix = np.zeros([len(header), len(header)], int)
-    for idx, i in enumerate(seq):
-        for idx2, j in enumerate(seq):
-            d = 0
-            h1 = header[idx]
-            h2 = header[idx2]
-            if len(i) != len(j):    # Throw a warning -> program doesnt do anything -> dont fill with gaps
-                print("Sequences of {} and {} are not of the same length. Skipping edit distance calculation.".format(h1[i], h1[j]))
-                continue
-            else:
-                d = sum(1 for (l, r) in zip(i, j) if l != r)
-
-            #print("idx: {}, idx2: {}, d: {}".format(idx, idx2, d))
-            result.append([(h1 + " - " + h2, d)])
-            matrix[idx, idx2] = d
-
+    n = len(header)
+    matrix = np.zeros([n, n], int)
+    lengths = [len(s) for s in seq]
+    if not levenshtein_only:
+        groups = {}
+        for idx, length in enumerate(lengths):
+            groups.setdefault(length, []).append(idx)
+        for idx in groups.values():
+            matrix[np.ix_(idx, idx)] = hamming_matrix(encode([seq[i] for i in idx]))
+        if k is not None:
+            np.minimum(matrix, k + 1, out=matrix)
+    pairs = [(i, j) for i in range(n) for j in range(i + 1, n) if levenshtein_only or lengths[i] != lengths[j]]
+    if pairs:
+        rows, cols = np.array(pairs).T
+        matrix[rows, cols] = matrix[cols, rows] = levenshtein_batch([(seq[i], seq[j]) for i, j in pairs], k)
     return matrix
 
 
-# calculate the edit distance
-mat = calc_edit_dist(header, seq)
+"""Out-of-core matrix"""
+def condensed_index(n, i, j):
+    """ index of pair (i, j), i < j, in a condensed upper triangle of an n x n matrix (scipy.spatial.distance order)"""
+    return n * i - i * (i + 1) // 2 + (j - i - 1)
+
+
+def compute_tile(out_path, codes_path, lengths_path, i0, i1, j0, j1, levenshtein_only=False, k=None):
+    """ computes tile rows i0:i1 x columns j0:j1 (i0 <= j0) of the distance matrix
+        and writes its upper triangle part into the condensed memmap out_path
+        :returns: (i0, i1, j0, j1) once the tile is flushed to disk"""
+    codes = np.load(codes_path, mmap_mode="r")
+    lengths = np.load(lengths_path, mmap_mode="r")
+    n = len(lengths)
+    out = np.load(out_path, mmap_mode="r+")
+    a, b = np.asarray(codes[i0:i1]), np.asarray(codes[j0:j1])
+    if levenshtein_only:
+        dist = np.zeros((len(a), len(b)), int)
+        other = np.ones(dist.shape, bool)
+    else:
+        dist = hamming_block(a, b)
+        if k is not None:
+            np.minimum(dist, k + 1, out=dist)
+        other = lengths[i0:i1, None] != lengths[None, j0:j1]
+    rows, cols = np.nonzero(other & (np.arange(i0, i1)[:, None] < np.arange(j0, j1)[None, :]))
+    if len(rows):
+        dist[rows, cols] = levenshtein_batch([(a[r, :lengths[i0 + r]].tobytes(), b[c, :lengths[j0 + c]].tobytes())
+                                              for r, c in zip(rows, cols)], k)
+    for r in range(i0, i1):
+        c0 = max(j0, r + 1) # only columns right of the diagonal
+        if c0 < j1:
+            start = condensed_index(n, r, c0)
+            out[start:start + j1 - c0] = dist[r - i0, c0 - j0:]
+    out.flush()
+    del out
+    return i0, i1, j0, j1
+
+
+def input_digest(seq):
+    """ sha256 of the lengths and the latin-1 encoded sequences, identifies the input of an out-of-core run"""
+    digest = hashlib.sha256(np.array([len(s) for s in seq], dtype=np.int64).tobytes())
+    for s in seq:
+        digest.update(s.encode("latin-1"))
+    return digest.hexdigest()
+
+
+def calc_edit_dist_out_of_core(seq, out_path, tile=TILE_SIZE, processes=None, levenshtein_only=False, k=None):
+    """ calculates the edit distances of all pairs tile by tile on a process pool
+        and stores them as condensed upper triangle (n * (n - 1) / 2 entries, int32) in the .npy file out_path.
+        finished tiles are logged to out_path.done -> an interrupted run is resumed by calling it again,
+        other sequences or settings than in the log start from scratch
+        :returns: condensed matrix opened as read only memmap"""
+    n = len(seq)
+    codes_path, lengths_path, done_path = out_path + ".codes.npy", out_path + ".lengths.npy", out_path + ".done"
+    # first line of the log, a run is only resumed with the same settings and input
+    settings = "# levenshtein_only={} k={} input={}\n".format(levenshtein_only, k, input_digest(seq))
+    done = set()
+    resume = all(os.path.isfile(path) for path in (done_path, out_path, codes_path, lengths_path))
+    if resume:
+        with open(done_path) as log:
+            resume = log.readline() == settings
+            done = {tuple(int(v) for v in line.split()) for line in log if line.strip()}
+        resume = resume and np.load(out_path, mmap_mode="r").shape == (n * (n - 1) // 2,)
+    if not resume:
+        done = set()
+        # encode sequences padded to the max. length, padding never differs between sequences of the same length
+        width = max((len(s) for s in seq), default=0)
+        codes = np.lib.format.open_memmap(codes_path, mode="w+", dtype=np.uint8, shape=(n, width))
+        for i, s in enumerate(seq):
+            codes[i, :len(s)] = np.frombuffer(s.encode("latin-1"), dtype=np.uint8)
+        codes.flush()
+        del codes
+        np.save(lengths_path, np.array([len(s) for s in seq], dtype=np.int64))
+        out = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.int32, shape=(n * (n - 1) // 2,))
+        del out
+        with open(done_path, "w") as log:
+            log.write(settings)
+
+    tiles = [(i0, min(i0 + tile, n), j0, min(j0 + tile, n))
+             for i0 in range(0, n, tile) for j0 in range(i0, n, tile)]
+    todo = [t for t in tiles if t not in done]
+    print("{} of {} tiles left to compute.".format(len(todo), len(tiles)))
+    with ProcessPoolExecutor(processes) as pool, open(done_path, "a") as log:
+        jobs = [pool.submit(compute_tile, out_path, codes_path, lengths_path, *t, levenshtein_only, k) for t in todo]
+        for count, job in enumerate(as_completed(jobs), 1):
+            log.write("{} {} {} {}\n".format(*job.result()))
+            log.flush()
+            print("\r{} / {} tiles".format(count, len(jobs)), end="")
+    print()
+    return np.load(out_path, mmap_mode="r")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calculates the edit distance d(s, t) of all sequences of a fasta file.")
+    parser.add_argument("Path",
+                        metavar="path",
+                        type=str,
+                        help="Input path of fasta file.")
+    parser.add_argument("--levenshtein",
+                        action="store_true",
+                        help="Use the Levenshtein distance for all pairs. By default it is only used for pairs "
+                             "of different length, pairs of the same length get the Hamming distance.")
+    parser.add_argument("-k",
+                        type=int,
+                        help="Optional threshold, stop computing a distance once it exceeds k and report k + 1.",
+                        default=None)
+    parser.add_argument("--out",
+                        type=str,
+                        help="Compute out-of-core and store the condensed upper triangle as .npy file "
+                             "(open with numpy.load(path, mmap_mode='r')) instead of printing the matrix. "
+                             "Rerun the same command to resume an interrupted run.",
+                        default=None)
+    parser.add_argument("--tile",
+                        type=int,
+                        help="Rows per tile in out-of-core mode. Default = {}.".format(TILE_SIZE),
+                        default=TILE_SIZE)
+    parser.add_argument("--processes",
+                        type=int,
+                        help="Number of worker processes in out-of-core mode. Default = number of CPUs.",
+                        default=None)
+    args = parser.parse_args()
+    inPath = args.Path
+
+    """ read file """
+    header = []
+    seq = []
+    for head, s in f.iter_records(inPath):
+        header.append(head)
+        seq.append(s)
+
+    if args.out is not None:
+        calc_edit_dist_out_of_core(seq, args.out, args.tile, args.processes, args.levenshtein, args.k)
+        print("Condensed distance matrix of {} sequences written to {}".format(len(seq), args.out))
+        return
+
+    # calculate the edit distance
+    mat = calc_edit_dist(header, seq, args.levenshtein, args.k)
+
+    # assign matrix to pd.dataframe with headers as col and rows
+    out = pd.DataFrame(mat, columns=header, index=header)
+    # print matrix without truncation
+    pd.set_option("display.max_rows", None)
+    pd.set_option("display.max_columns", None)
+    # print result to console
+    print("d(s, t) of all sequences from given file:")
+    print(out)
+
 
-# assign matrix to pd.dataframe with headers as col and rows
-out = pd.DataFrame(mat, columns=header, index=header)
-# print matrix without truncation
-pd.set_option("display.max_rows", None)
-pd.set_option("display.max_columns", None)
-#print(result)
-#print(matrix)
-# print result to console
-print("d(s, t) of all sequences from given file:")
-print(out)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
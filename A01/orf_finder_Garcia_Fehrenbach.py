@@ -0,0 +1,185 @@
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import fasta_Garcia_Fehrenbach as f
+import translate_Garcia_Fehrenbach as tr
+
+"""ORF finder on top of the translation engine"""
+
+CHUNK_SIZE = 1 << 20 # bases scanned per chunk, multiple of 3
+IS_START = tr.CODON_TABLE == ord("M") # codon index -> start codon
+IS_STOP = tr.CODON_TABLE == ord("_") # codon index -> stop codon
+
+
+def reverse_complement(seq):
+    """reverse complement of a DNA sequence via the 2-bit codes of the translation engine"""
+    codes = tr.BASE_CODE[np.frombuffer(seq.encode("latin-1"), dtype=np.uint8)]
+    return np.frombuffer(b"TGCAN", dtype=np.uint8)[codes[::-1]].tobytes().decode("ascii")
+
+
+def scan_chunk(codes, offset):
+    """finds start and stop codons of both strands in a chunk of base codes
+        :param codes: base codes of the chunk incl. the 2 bases following it
+        :param offset: position of the chunk in the sequence
+        :returns: dict strand -> (start positions, stop positions), positions of the first base of the
+        codon on the forward strand, codons with ambiguous bases are neither start nor stop"""
+    indices, ambiguous = tr.codon_indices(codes)
+    n = len(indices)
+    bases = codes & 3
+    # codon read on the reverse strand: complement of the 3 bases in reversed order
+    rc_indices = 63 - ((bases[2:n + 2] << 4) | (bases[1:n + 1] << 2) | bases[:n])
+    found = {}
+    for strand, idx in (("+", indices), ("-", rc_indices)):
+        starts = np.flatnonzero(IS_START[idx] & ~ambiguous) + offset
+        stops = np.flatnonzero(IS_STOP[idx] & ~ambiguous) + offset
+        found[strand] = (starts, stops)
+    return found
+
+
+def iter_orfs(seq, min_length=30, chunk_size=CHUNK_SIZE):
+    """
+    Finds open reading frames (start codon up to the next in-frame stop codon, the first start after a stop is used)
+    in all six frames. The sequence is scanned in chunks with vectorised searches for start and stop codons,
+    the open ORF of every frame is carried over chunk boundaries. Proteins are translated lazily per ORF.
+    :param seq: DNA sequence
+    :param min_length: minimal length of the protein in AA
+    :param chunk_size: bases per chunk
+    :return: generator of tuples (start, end, frame, protein), start/end are 0-based, end exclusive, on the forward
+    strand and include the stop codon, frame as in translate.translate_frames
+    """
+    length = len(seq)
+    chunk_size = max(3, chunk_size - chunk_size % 3)
+    # forward frames: first start since the last stop, reverse frames: last stop & last start since then
+    open_start = [None] * 3
+    last_stop = [None] * 3
+    best_start = [None] * 3
+    for c0 in range(0, max(length - 2, 0), chunk_size):
+        c1 = min(c0 + chunk_size, length - 2) # codon positions of this chunk
+        codes = tr.BASE_CODE[np.frombuffer(seq[c0:c1 + 2].encode("latin-1"), dtype=np.uint8)]
+        found = scan_chunk(codes, c0)
+        orfs = []
+        for frame in range(3):
+            # forward strand, ORF = first start after a stop .. next stop
+            starts, stops = (a[a % 3 == frame] for a in found["+"])
+            if len(stops):
+                idx = np.searchsorted(starts, np.concatenate(([-1], stops[:-1])), side="right")
+                first = np.append(starts, length)[idx] # first start after the previous stop
+                if open_start[frame] is not None:
+                    first[0] = open_start[frame]
+                valid = first < stops
+                orfs += [(start, stop + 3, "+{}".format(frame + 1)) for start, stop in zip(first[valid], stops[valid])]
+                starts = starts[starts > stops[-1]]
+                open_start[frame] = None
+            if open_start[frame] is None and len(starts):
+                open_start[frame] = starts[0]
+
+            # reverse strand, read from right to left: ORF = stop .. last start in front of the next stop
+            starts, stops = (a[(length - 3 - a) % 3 == frame] for a in found["-"])
+            if len(stops):
+                prev = np.concatenate(([-1 if last_stop[frame] is None else last_stop[frame]], stops[:-1]))
+                idx = np.searchsorted(starts, stops) - 1
+                last = np.append(starts, -1)[idx] # last start in front of each stop
+                if best_start[frame] is not None and last[0] <= prev[0]:
+                    last[0] = best_start[frame]
+                valid = last > prev
+                valid[0] &= last_stop[frame] is not None
+                orfs += [(stop, start + 3, "-{}".format(frame + 1)) for stop, start in zip(prev[valid], last[valid])]
+                last_stop[frame] = stops[-1]
+                best_start[frame] = None
+                starts = starts[starts > stops[-1]]
+            if last_stop[frame] is not None and len(starts):
+                best_start[frame] = starts[-1]
+        orfs.sort()
+        yield from _with_protein(seq, orfs, min_length)
+    # reverse strand ORFs reaching up to the end of the sequence
+    orfs = [(last_stop[frame], best_start[frame] + 3, "-{}".format(frame + 1))
+            for frame in range(3) if last_stop[frame] is not None and best_start[frame] is not None]
+    yield from _with_protein(seq, sorted(orfs), min_length)
+
+
+def _with_protein(seq, orfs, min_length):
+    """translates ORFs (start, end, frame) with at least min_length AA"""
+    for start, end, frame in orfs:
+        start, end = int(start), int(end)
+        if (end - start) // 3 - 1 < min_length:
+            continue
+        if frame[0] == "+":
+            protein = tr.translate(seq[start:end - 3])
+        else:
+            protein = tr.translate(reverse_complement(seq[start + 3:end]))
+        yield start, end, frame, protein
+
+
+def find_orfs(record, min_length=30, chunk_size=CHUNK_SIZE):
+    """all ORFs of one fasta record (header, sequence) as list, used by the process pool"""
+    head, seq = record
+    return head, list(iter_orfs(seq, min_length, chunk_size))
+
+
+def iter_file_orfs(path, min_length=30, processes=None, chunk_size=CHUNK_SIZE):
+    """
+    Finds the ORFs of all records of a fasta file, records are streamed from the file.
+    :param processes: if set, contigs are scanned in parallel on a process pool of this size,
+    at most 2 contigs per process are read ahead
+    :return: generator of tuples (header, start, end, frame, protein)
+    """
+    records = f.iter_records(path)
+    if processes is None:
+        for head, seq in records:
+            for orf in iter_orfs(seq, min_length, chunk_size):
+                yield (head,) + orf
+        return
+    with ProcessPoolExecutor(processes) as pool:
+        pending = deque()
+        for record in records:
+            pending.append(pool.submit(find_orfs, record, min_length, chunk_size))
+            while len(pending) > 2 * processes or (pending and pending[0].done()):
+                head, orfs = pending.popleft().result()
+                for orf in orfs:
+                    yield (head,) + orf
+        while pending:
+            head, orfs = pending.popleft().result()
+            for orf in orfs:
+                yield (head,) + orf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Finds open reading frames in all six frames of the sequences "
+                                                 "of a fasta file and writes them as tab separated lines "
+                                                 "(header, start, end, frame, protein), "
+                                                 "positions are 0-based on the forward strand, end exclusive.")
+    parser.add_argument("Path",
+                        metavar="path",
+                        type=str,
+                        help="Input path of fasta file.")
+    parser.add_argument("outPath",
+                        metavar="out",
+                        type=str,
+                        nargs="?",
+                        help="Output path of the ORF table. If not specified the ORFs are printed to console.",
+                        default=None)
+    parser.add_argument("--min-length",
+                        type=int,
+                        help="Minimal length of the proteins in AA. Default = 30.",
+                        default=30)
+    parser.add_argument("--processes",
+                        type=int,
+                        help="Scan contigs in parallel on a process pool of this size.",
+                        default=None)
+    args = parser.parse_args()
+
+    orfs = iter_file_orfs(args.Path, args.min_length, args.processes)
+    lines = ("{}\t{}\t{}\t{}\t{}\n".format(head[1:], start, end, frame, protein)
+             for head, start, end, frame, protein in orfs)
+    if args.outPath is not None:
+        with open(args.outPath, "w") as out:
+            out.writelines(lines)
+        print("ORFs written to {}".format(args.outPath))
+    else:
+        for line in lines:
+            print(line, end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-import sys
+import argparse
+import numpy as np
 import fasta_Garcia_Fehrenbach as f
 
 """ Task 04 """
@@ -30,36 +31,88 @@ DNA_Codons = {
 }
 
 
+# 2-bit base codes A = 0, C = 1, G = 2, T = 3, every other char -> 4 (ambiguous)
+BASES = "ACGT"
+BASE_CODE = np.full(256, 4, dtype=np.uint8)
+for code, base in enumerate(BASES):
+    BASE_CODE[ord(base)] = code
+    BASE_CODE[ord(base.lower())] = code
+# 64 entry lookup table, codon index = 16 * code(1st base) + 4 * code(2nd base) + code(3rd base)
+CODON_TABLE = np.array([ord(DNA_Codons[a + b + c]) for a in BASES for b in BASES for c in BASES], dtype=np.uint8)
+AMBIGUOUS_AA = ord("X") # AA of codons with N or other ambiguous bases
+FRAMES = ["+1", "+2", "+3", "-1", "-2", "-3"]
+
+
+def codon_indices(codes):
+    """Calculates the codon index of every position of a base code array
+        :returns: (indices, ambiguous) arrays of length len(codes) - 2"""
+    n = max(len(codes) - 2, 0)
+    ambiguous = (codes == 4)
+    ambiguous = ambiguous[:n] | ambiguous[1:n + 1] | ambiguous[2:n + 2]
+    bases = codes & 3
+    indices = (bases[:n] << 4) | (bases[1:n + 1] << 2) | bases[2:n + 2]
+    return indices, ambiguous
+
+
+def translate_frames(seq, frames=FRAMES):
+    """Translate a DNA sequence in all six reading frames
+        bases are mapped to 2-bit codes, the codon indices of all positions of both strands are
+        computed at once and translated via a 64 entry lookup table, codons with ambiguous bases -> 'X'
+        :returns: dict frame -> AA sequence as string, frames +1, +2, +3 start at position 0, 1, 2 of seq,
+        -1, -2, -3 at position 0, 1, 2 of the reverse complement"""
+    codes = BASE_CODE[np.frombuffer(seq.encode("latin-1"), dtype=np.uint8)]
+    strands = {"+": codon_indices(codes)}
+    if any(frame[0] == "-" for frame in frames):
+        rc = np.where(codes == 4, 4, 3 - codes)[::-1] # complement of a code c is 3 - c
+        strands["-"] = codon_indices(rc)
+    out = {}
+    for frame in frames:
+        indices, ambiguous = strands[frame[0]]
+        start = int(frame[1]) - 1
+        aa = CODON_TABLE[indices[start::3]]
+        aa[ambiguous[start::3]] = AMBIGUOUS_AA
+        out[frame] = aa.tobytes().decode("ascii")
+    return out
+
+
 def translate(seq, init_pos=0):
     """Translate a DNA sequence into AA sequence
         :returns: AA sequence as string"""
-    sAA = [DNA_Codons[seq[pos:pos + 3]] for pos in range(init_pos, len(seq) - 2, 3)] # calcs single AAs from seq
-    seqAA = "".join(sAA) # join sAA list to AA seq
-    return seqAA
-
-# variables
-inPath = sys.argv[1]
-if len(sys.argv) == 3:
-    outPath = sys.argv[2]
-header = []
-seq = []
-tseq = []
-
-# read file
-data = f.read(inPath)
-for i in range(len(data)):
-    header.append(data[i][0])
-    seq.append(data[i][1])
-
-# translate
-for s in seq:
-    tseq.append(translate(s))
-
-out = [(header[i], tseq[i]) for i in range(0, len(header))]
-
-# write to console if outPath is not specified as 2nd argument
-if len(sys.argv) == 3:
-    f.write(out, outPath)
-    print("Translated sequences written to {}".format(outPath))
-else:
-    f.write(out)
+    return translate_frames(seq[init_pos:], ["+1"])["+1"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Translates the DNA sequences of a fasta file into AA sequences.")
+    parser.add_argument("Path",
+                        metavar="path",
+                        type=str,
+                        help="Input path of fasta file.")
+    parser.add_argument("outPath",
+                        metavar="out",
+                        type=str,
+                        nargs="?",
+                        help="Output path of fasta file. If not specified the translation is printed to console.",
+                        default=None)
+    parser.add_argument("--six-frames",
+                        action="store_true",
+                        help="Translate all three forward and three reverse complement frames, "
+                             "the frame is appended to each header.")
+    args = parser.parse_args()
+
+    # read file & translate record by record
+    if args.six_frames:
+        out = ((head + " frame=" + frame, aa) for head, s in f.iter_records(args.Path)
+               for frame, aa in translate_frames(s).items())
+    else:
+        out = ((head, translate(s)) for head, s in f.iter_records(args.Path))
+
+    # write to console if outPath is not specified as 2nd argument
+    if args.outPath is not None:
+        f.write(out, args.outPath)
+        print("Translated sequences written to {}".format(args.outPath))
+    else:
+        f.write(out)
+
+
+if __name__ == "__main__":
+    main()
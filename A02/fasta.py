@@ -1,25 +1,319 @@
 """ FastA file handler
-    :functions: read(path)"""
+    :functions: read(path), iter_records(path), build_index(path), load_index(path), open_fasta(path)
+    :classes: IndexedFasta(path), MemoryFasta(records)"""
+import gzip
+import mmap
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+BLOCK_SIZE = 1 << 22 # read files in blocks of 4 MiB
+WHITESPACE = b" \t\r\n"
+GZIP_MAGIC = b"\x1f\x8b\x08"
+
+
+def compression(path):
+    """detects the compression of a file by its magic bytes
+        :returns: "bgzf", "gzip" or None for plain files"""
+    with open(path, 'rb') as f:
+        head = f.read(18)
+    if not head.startswith(GZIP_MAGIC):
+        return None
+    # BGZF: FEXTRA flag set and extra subfield 'BC' with the block size
+    if head[3] & 4 and len(head) == 18 and head[12:14] == b"BC":
+        return "bgzf"
+    return "gzip"
+
+
+def iter_blocks(path, block_size=BLOCK_SIZE, threads=None):
+    """reads a plain, gzip or bgzip compressed file in blocks of about block_size bytes
+        gzip is decompressed streaming, BGZF blocks are decompressed in parallel on a thread pool
+        :returns: generator of bytes, ends with an empty block"""
+    kind = compression(path)
+    if kind == "bgzf":
+        yield from _iter_bgzf_blocks(path, block_size, threads or os.cpu_count() or 1)
+    else:
+        with (gzip.open(path, 'rb') if kind == "gzip" else open(path, 'rb')) as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                yield block
+    yield b""
+
+
+def _inflate_bgzf(raw):
+    """decompresses the deflate data of one BGZF block and checks its CRC32 and size"""
+    xlen = struct.unpack_from("<H", raw, 10)[0]
+    crc, size = struct.unpack_from("<II", raw, len(raw) - 8)
+    data = zlib.decompress(raw[12 + xlen:-8], -15)
+    if len(data) != size or zlib.crc32(data) != crc:
+        raise ValueError("Corrupt BGZF block.")
+    return data
+
+
+def _iter_bgzf_blocks(path, block_size, threads):
+    """reads BGZF blocks, decompresses them on a thread pool (zlib releases the GIL)
+        and yields the data in file order joined to about block_size bytes"""
+    pending = deque()
+    out = []
+    out_size = 0
+    with open(path, 'rb') as f, ThreadPoolExecutor(threads) as pool:
+        while True:
+            header = f.read(18)
+            if header:
+                if len(header) < 18 or not header.startswith(GZIP_MAGIC) or header[12:14] != b"BC":
+                    raise ValueError("Truncated or invalid BGZF block in {}.".format(path))
+                bsize = struct.unpack_from("<H", header, 16)[0] + 1 # total block size
+                pending.append(pool.submit(_inflate_bgzf, header + f.read(bsize - 18)))
+            # collect finished blocks in order, keep about 4 blocks per thread in flight
+            while pending and (not header or len(pending) > 4 * threads or pending[0].done()):
+                data = pending.popleft().result()
+                out.append(data)
+                out_size += len(data)
+                if out_size >= block_size:
+                    yield b"".join(out)
+                    out, out_size = [], 0
+            if not header:
+                break
+    if out:
+        yield b"".join(out)
+
+
+def iter_records(path, block_size=BLOCK_SIZE):
+    """reads in fasta file record by record
+        the file is read in binary blocks, the sequence of a record is collected in chunks
+        and joined once -> memory is bounded by the largest record
+        gzip and bgzip compressed files are detected and decompressed on the fly
+        :returns: generator of tuples (header, sequence)"""
+    head = None # header of the current record
+    chunks = [] # sequence chunks of the current record
+    buf = b"\n" # unprocessed data, starts with a line break so a '>' at the beginning is found as header
+    for block in iter_blocks(path, block_size):
+        buf += block
+        pos = 0
+        keep = len(buf) - 1 # the last byte may be the line break in front of a header
+        while True:
+            i = buf.find(b"\n>", pos) # start of next header
+            if i == -1:
+                break
+            j = buf.find(b"\n", i + 1) # end of header line
+            if j == -1:
+                if block: # header line is cut off -> read more
+                    keep = i
+                    break
+                j = len(buf)
+            chunks.append(buf[pos:i])
+            if head is not None or any(chunks): # yield previous record
+                yield _record(head, chunks)
+            head = buf[i + 1:j]
+            chunks = []
+            pos = j
+        if not block: # end of file
+            chunks.append(buf[pos:])
+            break
+        keep = max(keep, pos)
+        chunks.append(buf[pos:keep])
+        buf = buf[keep:]
+    if head is not None or any(chunks): # yield last record
+        yield _record(head, chunks)
+
+
+def _record(head, chunks):
+    """builds a (header, sequence) tuple from a header line and the sequence chunks of one record"""
+    head = head.rstrip().decode() if head is not None else ""
+    return head, b"".join(chunks).translate(None, WHITESPACE).decode("latin-1")
+
 
 def read(path):
-    """reads in fasta file"""
-    heads = []
-    head = ""
-    seqs = []
-    seq = ""
-    with open(path, 'r') as f:
+    """reads in fasta file
+        :returns: data as list of tuple (header, sequence)"""
+    return list(iter_records(path))
+
+
+def build_index(path):
+    """scans a fasta file once and computes a .fai index (samtools faidx format)
+        all lines of a record except the last one must have the same length
+        :returns: list of tuples (name, length, offset, line_bases, line_width)"""
+    index = []
+    entry = None # [name, length, offset, line_bases, line_width] of current record
+    last_line = False # True after a line shorter than the line length of the record
+    offset = 0
+    with open(path, 'rb') as f:
         for line in f:
-            line = line.rstrip()
-            if line.startswith(">"):
-                if seq != "": # append seq + head to their lists
-                    seqs.append(seq)
-                    heads.append(head)
-                    seq = ""
-                head = line # save current line to head if it startswith >
-            else:
-                seq += line # add current line to seq -> necessary to read in each sequence line
-        seqs.append(seq) # add last seq to seqs array
-        heads.append(head) # add last header to heads array
-        data = [(heads[i], seqs[i]) for i in range(0, len(heads))] # combine to data
-
-        return data
+            width = len(line)
+            offset += width
+            if line.startswith(b">"):
+                if entry is not None:
+                    index.append(tuple(entry))
+                name = line[1:].split(None, 1)[0].decode() if line[1:].strip() else ""
+                entry = [name, 0, offset, 0, 0]
+                last_line = False
+                continue
+            bases = len(line.rstrip(b"\r\n"))
+            if entry is None:
+                continue
+            if bases == 0: # empty line, only allowed at the end of a record
+                last_line = True
+                continue
+            if last_line:
+                raise ValueError("Different line length in sequence {}.".format(entry[0]))
+            if entry[3] == 0: # first line of the sequence defines the line length
+                entry[3], entry[4] = bases, width
+            elif bases > entry[3]:
+                raise ValueError("Different line length in sequence {}.".format(entry[0]))
+            last_line = bases < entry[3]
+            entry[1] += bases
+    if entry is not None:
+        index.append(tuple(entry))
+    return index
+
+
+def write_index(index, fai_path):
+    """writes a .fai index as tab separated lines"""
+    with open(fai_path, 'w') as f:
+        for entry in index:
+            f.write("\t".join(str(e) for e in entry) + "\n")
+
+
+def read_index(fai_path):
+    """reads in .fai index
+        :returns: list of tuples (name, length, offset, line_bases, line_width)"""
+    index = []
+    with open(fai_path, 'r') as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            index.append((fields[0],) + tuple(int(v) for v in fields[1:5]))
+    return index
+
+
+def load_index(path):
+    """returns the index of a fasta file, reads path.fai if it is up to date
+        else builds the index and tries to save it next to the fasta file"""
+    fai_path = path + ".fai"
+    if os.path.isfile(fai_path) and os.path.getmtime(fai_path) >= os.path.getmtime(path):
+        return read_index(fai_path)
+    index = build_index(path)
+    try:
+        write_index(index, fai_path)
+    except OSError: # e.g. read only directory -> keep index in memory only
+        pass
+    return index
+
+
+class IndexedFasta:
+    """
+    Random access to the records of a fasta file via its .fai index.
+    The file is memory mapped, fetching a sequence or a subrange [start:end] only touches
+    the bytes of that range, line breaks are skipped by arithmetic on the line length.
+    """
+    def __init__(self, path):
+        if compression(path) is not None:
+            raise ValueError("Compressed fasta files can not be memory mapped, decompress {} first.".format(path))
+        self.path = path
+        self.index = load_index(path)
+        self.names = [entry[0] for entry in self.index]
+        self.entries = {entry[0]: entry for entry in self.index}
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def _byte(self, entry, pos):
+        """byte offset of sequence position pos within the file"""
+        name, length, offset, line_bases, line_width = entry
+        return offset + (pos // line_bases) * line_width + pos % line_bases
+
+    def fetch(self, name, start=0, end=None):
+        """
+        Returns the sequence of record name or its subrange [start:end] (0-based, end exclusive).
+        :param name: name of the record, first word of the header
+        :param start: start position
+        :param end: end position, default is the end of the sequence
+        :return: sequence as string
+        """
+        entry = self.entries[name]
+        length = entry[1]
+        end = length if end is None else min(end, length)
+        start = max(start, 0)
+        if start >= end:
+            return ""
+        raw = self.map[self._byte(entry, start):self._byte(entry, end - 1) + 1]
+        if entry[4] != entry[3]: # remove line breaks
+            raw = raw.translate(None, b"\r\n")
+        return raw.decode("latin-1")
+
+    def header(self, name):
+        """returns the full header line of record name"""
+        offset = self.entries[name][2]
+        start = self.map.rfind(b"\n", 0, offset - 1) + 1 # header is the line in front of the sequence
+        return self.map[start:offset].rstrip().decode()
+
+    def record(self, idx):
+        """returns record number idx as tuple (header, sequence) like read()"""
+        name = self.names[idx]
+        return self.header(name), self.fetch(name)
+
+
+class MemoryFasta:
+    """
+    The records of a fasta file in memory with the interface of IndexedFasta,
+    for files that can not be indexed, e.g. with lines of different length.
+    """
+    def __init__(self, records):
+        self.headers = {}
+        self.seqs = {}
+        self.names = []
+        for head, seq in records:
+            name = head[1:].split(None, 1)[0] if head[1:].strip() else ""
+            self.headers[name], self.seqs[name] = head, seq
+            self.names.append(name)
+        self.entries = self.seqs
+
+    def __len__(self):
+        return len(self.names)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def fetch(self, name, start=0, end=None):
+        """sequence of record name or its subrange [start:end] like IndexedFasta.fetch"""
+        return self.seqs[name][max(start, 0):end]
+
+    def header(self, name):
+        """returns the full header line of record name"""
+        return self.headers[name]
+
+    def record(self, idx):
+        """returns record number idx as tuple (header, sequence) like read()"""
+        name = self.names[idx]
+        return self.headers[name], self.seqs[name]
+
+
+def open_fasta(path):
+    """random access to the records of a fasta file: IndexedFasta if the file can be indexed,
+        else all records are read into a MemoryFasta
+        :returns: IndexedFasta or MemoryFasta"""
+    try:
+        return IndexedFasta(path)
+    except ValueError: # build_index: lines of different length
+        return MemoryFasta(iter_records(path))
@@ -2,97 +2,337 @@ import os
 import sys
 import fasta
 import argparse
+import itertools
+import json
 import nw
+import gotoh
+import sw
+import scoring
 import tracemalloc
 import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
+CHUNK_SIZE = 64 # pairs per task in batch mode
+AFFINE_MODES = (7, 8, 9, 10) # modes that need a scoring.Scoring
 
-"""Handling command line arguments"""
-parser = argparse.ArgumentParser(description="Aligns two sequences from fasta file with Needleman-Wunsch variations.")
-parser.add_argument("Path",
-                    metavar="path",
-                    type=str,
-                    help="Input path of fasta file.")
-parser.add_argument("--mode",
-                    action="store",
-                    type=int,
-                    help="0: NW basic (default), 1: NW with linear space, 2: NW without table",
-                    default=0)
-parser.add_argument("--stat",
-                    action="store_true",
-                    help="If set prints out time and memory consumption the specified algorithm needed for calculation.")
-
-args = parser.parse_args()
-inPath = args.Path
-mode = args.mode
-stat = args.stat
-
-# break if no file path is specified
-if not os.path.isfile(inPath):
-    print("Specified path does not exist.")
-    sys.exit()
-
-"""get data & parse needleman wunsch, this will only work for the first 2 seqs specified in fasta"""
-data = fasta.read(inPath)
-x = data[0][1]
-y = data[1][1]
-
-"""run calculation with statistics"""
-if stat:
-    if mode == 0:
-        tracemalloc.start()
-        start_time = time.time()
-        sltn = nw.nw_basic(x, y)
-        current, peak = tracemalloc.get_traced_memory()
-        print("The optimal global alignment of {} vs. {} is:\n{}\n{}"
-              .format(data[0][0], data[1][0], sltn[0], sltn[1]))
-        print("With a score of {}.".format(sltn[2]))
-        print("The algorithm needed {} s to align both sequences.".format(time.time()-start_time))
-        print("Memory usage: current = {} bytes, peak = {} bytes".format(current, peak))
-        tracemalloc.reset_peak()
+"""headline of the printed alignment per mode"""
+TITLES = {0: "The optimal global alignment of {} vs. {} is:",
+          1: "The optimal global alignment of {} vs. {} using the Hirschberg algorithm is:",
+          2: "The optimal global alignment score of {} vs. {} using NW without table:",
+          3: "The optimal global alignment of {} vs. {} using a packed traceback is:",
+          4: "The global alignment of {} vs. {} using a band is:",
+          5: "A global alignment of {} vs. {} using X-drop is:",
+          6: "The optimal global alignment score of {} vs. {} from bit-parallel difference vectors:",
+          7: "The optimal global alignment of {} vs. {} with affine gaps is:",
+          8: "The optimal global alignment of {} vs. {} with affine gaps in linear space is:",
+          9: "The global alignment of {} vs. {} with affine gaps using a band is:",
+          10: "The optimal local alignment of {} in {} with affine gaps is:"}
 
-    elif mode == 1:
-        tracemalloc.start()
-        start_time = time.time()
-        sltn = nw.nw_linear_space(x,y)#nw.nw_hirschberg(x, y)
-        current, peak = tracemalloc.get_traced_memory()
-        print("The optimal global alignment using the Hirschberg algorithm is:\n{}\n{}".format(sltn[0], sltn[1]))
-        print("With a score of {}.".format(sltn[2]))
-        print("The algorithm needed {} s to align".format(time.time() - start_time))
-        print("Memory usage: current = {} bytes, peak = {} bytes".format(current, peak))
-        tracemalloc.reset_peak()
 
+def align(mode, x, y, band=None, xdrop=20, scores=None, processes=None):
+    """runs the Needleman-Wunsch variation of the given mode
+    :param scores: scoring.Scoring of the affine gap modes 7-10
+    :param processes: mode 1 runs the Hirschberg recursion on this many processes if set
+    :returns: tuple (seqX, seqY, score), the alignment is None for score only modes,
+    mode 10 adds the aligned regions (start, end) of x and y
+    :raises ValueError: if the mode does not exist or X-drop pruned the end of the alignment"""
+    if mode == 0:
+        return nw.nw_basic(x, y)
+    elif mode == 1:
+        if processes is not None:
+            return nw.nw_linear_space_parallel(x, y, processes=processes)
+        return nw.nw_linear_space(x, y)
     elif mode == 2:
-        tracemalloc.start()
-        start_time = time.time()
-        sltn = nw.nw_wo_table(x, y)
-        current, peak = tracemalloc.get_traced_memory()
-        #print("A possible optimal global alignment using NW without table is:\n{}\n{}".format(sltn[0], sltn[1]))
-        print("With a score of {}.".format(sltn))
-        print("The algorithm needed {} s to align".format(time.time() - start_time))
-        print("Memory usage: current = {} bytes, peak = {} bytes".format(current, peak))
-        tracemalloc.reset_peak()
+        return None, None, nw.nw_wo_table(x, y)
+    elif mode == 3:
+        return nw.nw_packed(x, y)
+    elif mode == 4:
+        return nw.nw_banded(x, y, band=band)
+    elif mode == 5:
+        return nw.nw_xdrop(x, y, xdrop=xdrop)
+    elif mode == 6:
+        return None, None, float(nw.nw_score_bits(x, y))
+    elif mode == 7:
+        return gotoh.gotoh(x, y, scores)
+    elif mode == 8:
+        return gotoh.gotoh_linear_space(x, y, scores)
+    elif mode == 9:
+        return gotoh.gotoh_banded(x, y, scores, band)
+    elif mode == 10:
+        return sw.sw_align(x, y, scores)
+    raise ValueError("No viable mode. Mode must be either {}".format(", ".join(str(m) for m in TITLES)))
+
+
+def fetch_region(fa, region):
+    """fetches NAME or NAME:START-END from an indexed fasta file
+    :returns: tuple (header, sequence)
+    :raises ValueError: if there is no record NAME"""
+    name, _, span = region.partition(":")
+    if name not in fa.entries:
+        raise ValueError("No record named {} in the fasta file.".format(name))
+    start, end = 0, None
+    if span:
+        start, _, end = span.partition("-")
+        start, end = int(start), int(end) if end else None
+    header = fa.header(name)
+    if span:
+        header += ":{}-{}".format(start, end if end is not None else "")
+    return header, fa.fetch(name, start, end)
+
+
+"""batch mode"""
+_fa = None # fasta file of a worker process, IndexedFasta or MemoryFasta
+_scores = None # scoring.Scoring of a worker process, None for modes 0-6
+
+
+def _init_worker(path, scores=None):
+    """opens the fasta file once per worker process, compressed or not indexable files are read into memory,
+    the scoring is sent once per process instead of with every chunk"""
+    global _fa, _scores
+    _fa = fasta.open_fasta(path)
+    _scores = scores
+
 
+def align_chunk(pairs, mode, band, xdrop):
+    """aligns a chunk of pairs of regions in a worker process, a pair that fails gives an error row
+    :returns: list of tuples (region x, region y, score, seqX, seqY, aligned range of x, aligned range of y, error),
+    the ranges (start, end) are only set by mode 10"""
+    results = []
+    for rx, ry in pairs:
+        try:
+            x, y = fetch_region(_fa, rx)[1], fetch_region(_fa, ry)[1]
+            sltn = align(mode, x, y, band, xdrop, _scores)
+            seqX, seqY, score = sltn[:3]
+            score = float(score)
+            spanX, spanY = sltn[3:5] if len(sltn) > 3 else (None, None)
+            results.append((rx, ry, score, seqX, seqY, spanX, spanY, None))
+        except (ValueError, KeyError, IndexError) as e:
+            results.append((rx, ry, None, None, None, None, None, "{}: {}".format(type(e).__name__, e)))
+    return results
+
+
+def read_pairs(path):
+    """reads pairs of regions (NAME or NAME:START-END), two per line separated by whitespace, # starts a comment
+    :returns: generator of tuples (region x, region y)"""
+    with open(path) as f:
+        for line in f:
+            fields = line.split("#", 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) != 2:
+                raise ValueError("Expected two regions per line in {}, got: {}".format(path, line.strip()))
+            yield fields[0], fields[1]
+
+
+def align_batch(path, pairs, mode, band=None, xdrop=20, processes=None, chunk_size=CHUNK_SIZE, scores=None):
+    """aligns many pairs on a process pool, pairs are sent in chunks, at most 4 chunks per process are in flight
+    :param pairs: iterable of tuples (region x, region y), read lazily
+    :param scores: scoring.Scoring of the affine gap modes 7-10, sent once to every worker
+    :returns: generator of result tuples of align_chunk in completion order"""
+    processes = processes or os.cpu_count() or 1
+    chunks = iter(lambda: list(itertools.islice(pairs, chunk_size)), [])
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(path, scores)) as pool:
+        pending = set()
+        for chunk in itertools.chain(chunks, [None]):
+            if chunk is not None:
+                pending.add(pool.submit(align_chunk, chunk, mode, band, xdrop))
+            # wait if the pool is full or all chunks are submitted
+            while pending and (chunk is None or len(pending) >= 4 * processes):
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for job in finished:
+                    yield from job.result()
+
+
+def format_result(result, fmt):
+    """formats a result of align_chunk as tsv or json line, aligned ranges are written as start-end resp. list"""
+    rx, ry, score, seqX, seqY, spanX, spanY, error = result
+    if fmt == "jsonl":
+        return json.dumps({"x": rx, "y": ry, "score": score, "seqX": seqX, "seqY": seqY,
+                           "rangeX": spanX, "rangeY": spanY, "error": error}) + "\n"
+    spanX, spanY = ("{}-{}".format(*span) if span is not None else None for span in (spanX, spanY))
+    return "\t".join("" if v is None else str(v) for v in (rx, ry, score, seqX, seqY, spanX, spanY, error)) + "\n"
+
+
+def get_scoring(args):
+    """scoring of the affine gap modes from the command line arguments, None for the other modes
+    :raises ValueError: if the substitution matrix file is invalid"""
+    if args.mode not in AFFINE_MODES:
+        return None
+    if args.matrix is None:
+        return scoring.Scoring.simple(1, -1, args.gap_open, args.gap_extend)
+    return scoring.Scoring.from_name(args.matrix, args.gap_open, args.gap_extend)
+
+
+def run_batch(args):
+    """batch mode: aligns all vs. all records or the pairs of a pairs file and streams the results"""
+    if args.all_vs_all:
+        with fasta.open_fasta(args.Path) as fa:
+            names = list(fa.names)
+        pairs = itertools.combinations(names, 2)
+        total = len(names) * (len(names) - 1) // 2
     else:
-        print("No viable mode. Mode must be either 0, 1 or 2")
+        pairs = read_pairs(args.pairs)
+        total = None
+    scores = get_scoring(args)
+    out = open(args.out, "w") if args.out is not None else sys.stdout
+    try:
+        if args.format == "tsv":
+            out.write("#x\ty\tscore\tseqX\tseqY\trangeX\trangeY\terror\n")
+        start_time = time.time()
+        count = 0
+        for result in align_batch(args.Path, pairs, args.mode, args.band, args.xdrop,
+                                  args.processes, args.chunk_size, scores):
+            out.write(format_result(result, args.format))
+            count += 1
+            if count % args.chunk_size == 0 or count == total:
+                rate = count / max(time.time() - start_time, 1e-9)
+                print("\r{} / {} pairs, {:.1f} pairs/s".format(count, total if total is not None else "?", rate),
+                      end="", file=sys.stderr)
+        if count >= args.chunk_size: # end the progress line
+            print(file=sys.stderr)
+        print("{} pairs aligned in {:.2f} s".format(count, time.time() - start_time), file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
 
-else:
-    """run calculation without statistics"""
-    if mode == 0:
-        sltn = nw.nw_basic(x, y)
-        print("The optimal global alignment of {} vs. {} is:\n{}\n{}"
-              .format(data[0][0], data[1][0], sltn[0], sltn[1]))
-        print("With a score of {}.".format(sltn[2]))
 
-    elif mode == 1:
-        sltn = nw.nw_hirschberg(x, y)
-        print("The optimal global alignment using the Hirschberg algorithm is:\n{}\n{}".format(sltn[0], sltn[1]))
-        print("With a score of {}.".format(sltn[2]))
+def main():
+    """Handling command line arguments"""
+    parser = argparse.ArgumentParser(description="Aligns two sequences from fasta file with Needleman-Wunsch variations.")
+    parser.add_argument("Path",
+                        metavar="path",
+                        type=str,
+                        help="Input path of fasta file.")
+    parser.add_argument("--mode",
+                        action="store",
+                        type=int,
+                        help="0: NW basic (default), 1: NW with linear space, 2: NW without table, "
+                             "3: NW with int32 rolling row and 2-bit packed traceback, "
+                             "4: banded NW (fixed --band or adaptive), 5: NW with X-drop pruning (--xdrop), "
+                             "6: bit-parallel score only (exact, difference vectors), "
+                             "7: Gotoh affine gaps, 8: Gotoh affine gaps in linear space, "
+                             "9: banded Gotoh (fixed --band or adaptive), "
+                             "10: local alignment of the first sequence in the second (striped Smith-Waterman)",
+                        default=0)
+    select = parser.add_mutually_exclusive_group()
+    select.add_argument("--regions",
+                        nargs=2,
+                        metavar="REGION",
+                        type=str,
+                        help="Two sequences to align given as NAME or NAME:START-END (0-based, end exclusive), "
+                             "fetched via the .fai index of the fasta file (read completely if it can not be "
+                             "indexed). Default: the first two records.",
+                        default=None)
+    select.add_argument("--all-vs-all",
+                        action="store_true",
+                        help="Batch mode: align all pairs of records of the fasta file.")
+    select.add_argument("--pairs",
+                        type=str,
+                        help="Batch mode: align the pairs of regions listed in this file, "
+                             "two regions (NAME or NAME:START-END) per line.",
+                        default=None)
+    parser.add_argument("--band",
+                        type=int,
+                        help="Mode 4, 9: band width around the diagonal. If not set the band is doubled "
+                             "until the score is proven optimal.",
+                        default=None)
+    parser.add_argument("--xdrop",
+                        type=float,
+                        help="Mode 5: cells more than XDROP below the best score are pruned. Default = 20.",
+                        default=20)
+    parser.add_argument("--matrix",
+                        type=str,
+                        help="Mode 7-10: substitution matrix, BLOSUM62 or path of a matrix file in NCBI format "
+                             "(e.g. PAM250). Default: match 1, mismatch -1.",
+                        default=None)
+    parser.add_argument("--gap-open",
+                        type=float,
+                        help="Mode 7-10: gap opening cost, a gap of length k costs open + k * extend. Default = 10.",
+                        default=10)
+    parser.add_argument("--gap-extend",
+                        type=float,
+                        help="Mode 7-10: gap extension cost. Default = 1.",
+                        default=1)
+    parser.add_argument("--processes",
+                        type=int,
+                        help="Batch mode: number of worker processes. Default = number of CPUs. "
+                             "Mode 1: run the Hirschberg recursion in parallel on this many processes.",
+                        default=None)
+    parser.add_argument("--chunk-size",
+                        type=int,
+                        help="Batch mode: pairs per task sent to a worker. Default = {}.".format(CHUNK_SIZE),
+                        default=CHUNK_SIZE)
+    parser.add_argument("--format",
+                        choices=["tsv", "jsonl"],
+                        help="Batch mode: output format, results are written in completion order. Default = tsv.",
+                        default="tsv")
+    parser.add_argument("--out",
+                        type=str,
+                        help="Batch mode: output file. If not specified the results are printed to console.",
+                        default=None)
+    parser.add_argument("--stat",
+                        action="store_true",
+                        help="If set prints out time and memory consumption the specified algorithm needed for calculation.")
 
-    elif mode == 2:
-        sltn = nw.nw_wo_table(x, y)
-        #print("A possible optimal global alignment using NW without table is:\n{}\n{}".format(sltn[0], sltn[1]))
-        print("With a score of {}.".format(sltn))
+    args = parser.parse_args()
+    inPath = args.Path
+    mode = args.mode
+
+    # break if no file path is specified
+    if not os.path.isfile(inPath):
+        print("Specified path does not exist.")
+        sys.exit()
+    if mode not in TITLES:
+        print("No viable mode. Mode must be either {}".format(", ".join(str(m) for m in TITLES)))
+        sys.exit()
 
+    if args.all_vs_all or args.pairs is not None:
+        run_batch(args)
+        return
+
+    """get data: the first two records are streamed, regions are fetched via the fasta index"""
+    if args.regions is None: # first 2 seqs specified in fasta
+        data = list(itertools.islice(fasta.iter_records(inPath), 2))
     else:
-        print("No viable mode. Mode must be either 0, 1 or 2")
\ No newline at end of file
+        try:
+            with fasta.open_fasta(inPath) as fa:
+                data = [fetch_region(fa, region) for region in args.regions]
+        except ValueError as e:
+            print(e)
+            sys.exit()
+    if len(data) < 2:
+        print("The fasta file has to contain at least two sequences.")
+        sys.exit()
+    x = data[0][1]
+    y = data[1][1]
+
+    """run calculation, with statistics if set, the scoring is built before memory tracing starts"""
+    try:
+        scores = get_scoring(args)
+    except ValueError as e:
+        print(e)
+        sys.exit()
+    if args.stat:
+        tracemalloc.start()
+        start_time = time.time()
+    try:
+        sltn = align(mode, x, y, args.band, args.xdrop, scores, args.processes)
+    except ValueError as e:
+        print(e)
+        sys.exit()
+    if args.stat:
+        current, peak = tracemalloc.get_traced_memory()
+    print(TITLES[mode].format(data[0][0], data[1][0]))
+    if sltn[0] is not None:
+        print("{}\n{}".format(sltn[0], sltn[1]))
+    if len(sltn) > 3:
+        print("Aligned regions: {}-{} of the first and {}-{} of the second sequence.".format(*sltn[3], *sltn[4]))
+    print("With a score of {}.".format(sltn[2]))
+    if args.stat:
+        print("The algorithm needed {} s to align both sequences.".format(time.time() - start_time))
+        print("Memory usage: current = {} bytes, peak = {} bytes".format(current, peak))
+        tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()
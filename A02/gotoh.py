@@ -0,0 +1,255 @@
+""" Global alignment with affine gaps (Gotoh) and substitution matrices
+    :functions: gotoh(x, y, scoring), gotoh_linear_space(x, y, scoring), gotoh_banded(x, y, scoring, band)
+
+    Three matrices: H best score of (i, j), E ends with a gap in x (left), F ends with a gap in y (up)
+        F(i,j) = max(H(i-1,j) - o - e, F(i-1,j) - e)
+        E(i,j) = max(H(i,j-1) - o - e, E(i,j-1) - e)
+        H(i,j) = max(H(i-1,j-1) + s(x_i, y_j), E(i,j), F(i,j))
+    every row is computed vectorised: diagonal and F from the previous row, E by a prefix maximum."""
+import numpy as np
+import scoring as sc
+
+BASE_CELLS = 1 << 16 # subproblems up to this size are aligned with the full table
+ADAPTIVE_BAND = 16 # start width of the adaptive band
+# traceback bits of a cell: source of H (2 bits), E opened here, F opened here
+DIAG, LEFT, UP = 0, 1, 2
+E_OPEN, F_OPEN = 4, 8
+
+
+def _affine_row(diag, up_h, up_f, sub, o, e):
+    """computes one row (or a contiguous part of it) of H, E and F
+        :param diag: H(i-1, j-1), -inf for cells without diagonal neighbour
+        :param up_h: H(i-1, j)
+        :param up_f: F(i-1, j)
+        :param sub: substitution scores s(x_i, y_j)
+        :returns: tuple (H, F, traceback bits)"""
+    f = np.maximum(up_h - o - e, up_f - e)
+    h = np.maximum(diag + sub, f) # H without E
+    # E(j) = max_k<j (H(k) - o - e * (j - k)), H may be used without E since extending is cheaper than reopening
+    ramp = np.arange(len(h)) * e
+    best = np.maximum.accumulate(h - o + ramp)
+    gap_e = np.full(len(h), -np.inf)
+    gap_e[1:] = best[:-1] - ramp[1:]
+    h_full = np.maximum(h, gap_e)
+    bits = np.where(h_full == diag + sub, DIAG, np.where(h_full == f, UP, LEFT)).astype(np.uint8)
+    bits[1:] |= np.where(gap_e[1:] == h_full[:-1] - o - e, E_OPEN, 0).astype(np.uint8)
+    bits |= np.where(f == up_h - o - e, F_OPEN, 0).astype(np.uint8)
+    return h_full, f, bits
+
+
+def _traceback(x, y, bits, state):
+    """Traceback through the states H, E, F from the lower right corner to the upper left
+        :param bits: function (i, j) -> traceback bits of the cell
+        :param state: start state, DIAG (H) or UP (F)
+        :returns: tuple (seqX, seqY)"""
+    seqX = []
+    seqY = []
+    i, j = len(x), len(y)
+    state = None if state == DIAG else state # None = H
+    while i > 0 or j > 0:
+        b = bits(i, j)
+        if state is None:
+            src = b & 3
+            if src == DIAG:
+                seqX.append(x[i-1])
+                seqY.append(y[j-1])
+                i -= 1
+                j -= 1
+            else:
+                state = src
+        elif state == LEFT:
+            seqX.append('-')
+            seqY.append(y[j-1])
+            state = None if b & E_OPEN else LEFT
+            j -= 1
+        else:
+            seqX.append(x[i-1])
+            seqY.append('-')
+            state = None if b & F_OPEN else UP
+            i -= 1
+    return "".join(reversed(seqX)), "".join(reversed(seqY))
+
+
+def _edge_cases(x, y, scoring, tb, te):
+    """alignment if x or y is empty, a gap in y touching the start / end opens with tb / te"""
+    n, m = len(x), len(y)
+    if n == 0:
+        return "-" * m, y, -scoring.gap(m)
+    return x, "-" * n, -(min(tb, te) + n * scoring.gap_extend)
+
+
+def gotoh(x, y, scoring=None, tb=None, te=None):
+    """Global alignment with affine gaps, full table of traceback bits (1 byte per cell) and rolling score rows
+        :param scoring: scoring.Scoring, default match 1, mismatch -1, linear gap 1
+        :param tb: opening cost of a gap in y at the start of the alignment, default gap_open
+        :param te: opening cost of a gap in y at the end of the alignment, default gap_open
+        (used by gotoh_linear_space for gaps that continue across subproblems)
+        :returns: tuple (seqX, seqY, score)"""
+    scoring = scoring or sc.Scoring.simple()
+    x, y = str(x), str(y)
+    o, e = scoring.gap_open, scoring.gap_extend
+    tb = o if tb is None else tb
+    te = o if te is None else te
+    n, m = len(x), len(y)
+    if n == 0 or m == 0:
+        return _edge_cases(x, y, scoring, tb, te)
+    profile, rows = scoring.row_profile(x, y)
+    trace = np.empty((n+1, m+1), dtype=np.uint8)
+    # row 0: gap in x, F(0, 0) = -tb marks a gap in y that is already open with cost tb
+    h = -(o + np.arange(m+1) * e)
+    h[0] = 0
+    f = np.full(m+1, -np.inf)
+    f[0] = -tb
+    trace[0] = LEFT
+    trace[0, 1] |= E_OPEN
+    sub = np.zeros(m+1)
+    for i in range(1, n+1):
+        diag = np.concatenate(([-np.inf], h[:-1]))
+        sub[1:] = profile[rows[i-1]]
+        h, f, trace[i] = _affine_row(diag, h, f, sub, o, e)
+    state = DIAG
+    score = h[m]
+    if f[m] + o - te > score: # end with a gap in y that opens with te
+        score, state = f[m] + o - te, UP
+    seqX, seqY = _traceback(x, y, lambda i, j: trace[i, j], state)
+    return seqX, seqY, score
+
+
+def gotoh_last_row(x, y, scoring, tb):
+    """last rows H(n, j) and F(n, j) with two rolling rows, tb is the opening cost of a gap in y at the start
+        :returns: tuple (H, F) of float arrays of length m+1"""
+    o, e = scoring.gap_open, scoring.gap_extend
+    n, m = len(x), len(y)
+    h = -(o + np.arange(m+1) * e)
+    h[0] = 0
+    f = np.full(m+1, -np.inf)
+    f[0] = -tb
+    if n == 0:
+        return h, f
+    profile, rows = scoring.row_profile(x, y) if m else (np.zeros((1, 0)), np.zeros(n, dtype=np.intp))
+    sub = np.zeros(m+1)
+    for i in range(1, n+1):
+        diag = np.concatenate(([-np.inf], h[:-1]))
+        sub[1:] = profile[rows[i-1]]
+        h, f, _ = _affine_row(diag, h, f, sub, o, e)
+    return h, f
+
+
+def gotoh_linear_space(x, y, scoring=None):
+    """Global alignment with affine gaps in linear space (Myers & Miller):
+        x is halved, forward scores of the upper half and backward scores (reversed sequences) of the lower half
+        give the best cut of y, either through a cell (H + H) or through a gap in y crossing the middle (F + F + o),
+        then both halves are solved with the opening cost of a gap continuing across the cut set to 0.
+        Subproblems are kept on an explicit stack, small ones (<= BASE_CELLS) are solved with gotoh.
+        :returns: tuple (seqX, seqY, score)"""
+    scoring = scoring or sc.Scoring.simple()
+    x, y = str(x), str(y)
+    o = scoring.gap_open
+    partsX, partsY = [], []
+    stack = [(0, len(x), 0, len(y), o, o)]
+    while stack:
+        x0, x1, y0, y1, tb, te = stack.pop()
+        if y0 is None: # gap in y over x[x0:x1] in the middle of a crossing gap
+            partsX.append(x[x0:x1])
+            partsY.append("-" * (x1 - x0))
+            continue
+        n, m = x1 - x0, y1 - y0
+        if n <= 1 or m == 0 or n * m <= BASE_CELLS:
+            sltn = gotoh(x[x0:x1], y[y0:y1], scoring, tb, te)
+            partsX.append(sltn[0])
+            partsY.append(sltn[1])
+            continue
+        mid = x0 + n // 2
+        h_f, f_f = gotoh_last_row(x[x0:mid], y[y0:y1], scoring, tb)
+        h_b, f_b = gotoh_last_row(x[mid:x1][::-1], y[y0:y1][::-1], scoring, te)
+        through = h_f + h_b[::-1]
+        crossing = f_f + f_b[::-1] + o
+        cut = int(np.argmax(np.maximum(through, crossing)))
+        if through[cut] >= crossing[cut]:
+            stack.append((mid, x1, y0 + cut, y1, o, te))
+            stack.append((x0, mid, y0, y0 + cut, tb, o))
+        else: # x[mid-1] and x[mid] are in the crossing gap, the gaps of the halves continue it
+            stack.append((mid + 1, x1, y0 + cut, y1, 0, te))
+            stack.append((mid - 1, mid + 1, None, None, 0, 0))
+            stack.append((x0, mid - 1, y0, y0 + cut, tb, 0))
+    seqX, seqY = "".join(partsX), "".join(partsY)
+    return seqX, seqY, scoring.score_alignment(seqX, seqY)
+
+
+def _gotoh_band(x, y, lo, hi, scoring):
+    """Gotoh restricted to the diagonals lo <= j - i <= hi, column k of a band row holds cell j = i + lo + k
+        :returns: tuple (seqX, seqY, score)"""
+    o, e = scoring.gap_open, scoring.gap_extend
+    n, m = len(x), len(y)
+    width = hi - lo + 1
+    profile, rows = scoring.row_profile(x, y)
+    trace = np.full((n+1, width), LEFT, dtype=np.uint8)
+    # rows have an extra -inf cell at the end as upper neighbour of k = width-1
+    h = np.full(width+1, -np.inf)
+    f = np.full(width+1, -np.inf)
+    j1 = min(m, hi)
+    h[-lo:j1-lo+1] = -(o + np.arange(j1+1) * e)
+    h[-lo] = 0
+    f[-lo] = -o
+    if j1 >= 1:
+        trace[0, 1-lo] |= E_OPEN
+    for i in range(1, n+1):
+        j0, j1 = max(0, i+lo), min(m, i+hi)
+        k0, k1 = j0-i-lo, j1-i-lo
+        diag = h[k0:k1+1].copy()
+        sub = np.zeros(k1-k0+1)
+        if j0 == 0: # cell (i, 0) has no diagonal neighbour
+            diag[0] = -np.inf
+            sub[1:] = profile[rows[i-1], :j1]
+        else:
+            sub[:] = profile[rows[i-1], j0-1:j1]
+        cells, gaps, bits = _affine_row(diag, h[k0+1:k1+2], f[k0+1:k1+2], sub, o, e)
+        h = np.full(width+1, -np.inf)
+        f = np.full(width+1, -np.inf)
+        h[k0:k1+1], f[k0:k1+1] = cells, gaps
+        trace[i, k0:k1+1] = bits
+    k = m-n-lo
+    score, state = h[k], DIAG
+    seqX, seqY = _traceback(x, y, lambda i, j: trace[i, j-i-lo], state)
+    return seqX, seqY, score
+
+
+def _band_bound(x, y, lo, hi, scoring):
+    """Upper bound of the score of all alignments leaving the diagonals lo..hi: they need at least
+        g = |d| + |m-n-d| gap chars to touch diagonal d = lo-1 or hi+1 and open at least one gap,
+        so they have at most p = (n+m-g)/2 pairs. The pairs are bounded by the sum of the p best scores
+        s(x_i, any y_j) (resp. with x and y swapped), every pair less means two more gap chars.
+        :returns: the bound, -inf if no alignment leaves the band"""
+    n, m = len(x), len(y)
+    o, e = scoring.gap_open, scoring.gap_extend
+    profile, rows = scoring.row_profile(x, y)
+    best = [np.sort(profile.max(axis=1)[rows])[::-1], np.sort(profile.max(axis=0))[::-1]]
+    k = min(n, m)
+    top = np.minimum(*(np.concatenate(([0], np.cumsum(b[:k]))) for b in best)) # sum of the p best pairs
+    bound = -np.inf
+    for d in (lo-1, hi+1):
+        if -n <= d <= m:
+            g = abs(d) + abs(m-n-d)
+            p = np.arange(min(k, (n+m-g) // 2) + 1)
+            bound = max(bound, np.max(top[p] - o - (n+m-2*p) * e))
+    return bound
+
+
+def gotoh_banded(x, y, scoring=None, band=None):
+    """Global alignment with affine gaps restricted to a band around the diagonals from (0, 0) to (n, m)
+        -> time and memory O(n * w)
+        :param band: fixed band width w, the result is the best alignment within the band,
+        if None the band starts with ADAPTIVE_BAND and is doubled until the score reaches _band_bound
+        :returns: tuple (seqX, seqY, score)"""
+    scoring = scoring or sc.Scoring.simple()
+    x, y = str(x), str(y)
+    n, m = len(x), len(y)
+    if n == 0 or m == 0:
+        return _edge_cases(x, y, scoring, scoring.gap_open, scoring.gap_open)
+    w = ADAPTIVE_BAND if band is None else band
+    while True:
+        lo, hi = max(min(0, m-n) - w, -n), min(max(0, m-n) + w, m)
+        sltn = _gotoh_band(x, y, lo, hi, scoring)
+        if band is not None or (lo == -n and hi == m) or sltn[2] >= _band_bound(x, y, lo, hi, scoring):
+            return sltn
+        w = max(2 * w, 1)
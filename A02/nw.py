@@ -1,3 +1,6 @@
+import os
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
 """Task 01"""
@@ -9,6 +12,47 @@ def is_match(c1, c2, match=1, mismatch=-1):
         return mismatch
 
 
+def substitution_profile(x, y, match=1, mismatch=-1):
+    """Precomputes the substitution scores s(c, y_j) of every distinct char c of x against all chars of y
+    :returns: tuple (profile, rows), profile has one row per distinct char, rows[i] is the profile row of x[i]"""
+    xb = np.frombuffer(x.encode("latin-1"), dtype=np.uint8)
+    yb = np.frombuffer(y.encode("latin-1"), dtype=np.uint8)
+    chars, rows = np.unique(xb, return_inverse=True)
+    profile = np.where(yb[None, :] == chars[:, None], float(match), float(mismatch))
+    return profile, rows
+
+
+def nw_fill(x, y, match=1, mismatch=-1, gap=1):
+    """Fills the Needleman-Wunsch score matrix row by row, every row is one numpy operation:
+        the diagonal and upper candidates are computed for the whole row at once,
+        the left gaps F(i, j-1) - d are resolved by a prefix maximum
+        F(i,j) = max_k<=j (G(i,k) - (j-k) * d) = cummax(G(i,k) + k * d) - j * d
+        :returns: score matrix F as (n+1) x (m+1) float array"""
+    n, m = len(x), len(y)
+    f = np.empty((n+1, m+1))
+    f[:, 0] = np.linspace(0, -n*gap, n+1)
+    f[0, :] = np.linspace(0, -m*gap, m+1)
+    if n == 0 or m == 0:
+        return f
+    profile, rows = substitution_profile(x, y, match, mismatch)
+    ramp = np.arange(m+1) * gap
+    for i in range(n):
+        _next_row(f[i], f[i+1], profile[rows[i]], gap, ramp)
+    return f
+
+
+def _next_row(prev, row, sub, gap, ramp):
+    """computes row i of the score matrix from row i-1 in place, row[0] must be initialised
+        :param sub: substitution scores s(x_i, y_j) for all j
+        :param ramp: j * d for all j"""
+    # upper left -> match or mismatch, upper -> gap y
+    np.maximum(prev[:-1] + sub, prev[1:] - gap, out=row[1:])
+    # left -> gap x
+    row += ramp
+    np.maximum.accumulate(row, out=row)
+    row -= ramp
+
+
 def nw_basic(x, y, match=1, mismatch=-1, gap=1):
     """Global alignment via Needleman-Wunsch-algorithm:
         Initialization: F(i,0) = -i * d for all i = 0, 1, 2, ...., n
@@ -17,23 +61,13 @@ def nw_basic(x, y, match=1, mismatch=-1, gap=1):
                         F(i,j) = max(F(i-1, j) - d
                                     (F(i, j-1) - d
                         Score is alpha = F(n, m)
-        Traceback: From lower right corner to upper left."""
+        Traceback: From lower right corner to upper left.
+        x, y can be str or packed_seq.PackedSequence"""
+    x, y = str(x), str(y) # unpack PackedSequence once instead of unpacking single chars per cell
     n = len(x)
     m = len(y)
-    # Build score matrix
-    f = np.zeros((n+1, m+1))
-    # Initialization
-    f[:, 0] = np.linspace(0, -n*gap, n+1)
-    f[0, :] = np.linspace(0, -m*gap, m+1)
-    # Recursion
-    score = np.zeros(3)
-    for i in range(n):
-        for j in range(m):
-            score[0] = f[i, j] + is_match(x[i], y[j], match, mismatch) # upper left -> match or mismatch
-            score[1] = f[i, j+1] - gap # gap y
-            score[2] = f[i+1, j] - gap # gap x
-            maximum = np.max(score)
-            f[i+1, j+1] = maximum
+    # Build score matrix, rows are filled vectorised by nw_fill
+    f = nw_fill(x, y, match, mismatch, gap)
 
     # Traceback
     seqX = ""
@@ -80,78 +114,542 @@ def nw_basic(x, y, match=1, mismatch=-1, gap=1):
 
     return (seqX, seqY, f[n][m])
 
-"""Task 02"""
-def halved_score(x, y, match_score = 1, mismatch_score = -1, gap_penalty = 1):
-    """calculates partly scores of the matrix"""
+DIAG, UP, LEFT = 0, 1, 2 # traceback directions, 2 bits per cell
+
+
+def nw_packed(x, y, match=1, mismatch=-1, gap=1):
+    """Global alignment via Needleman-Wunsch-algorithm with integer scores (int32) in one rolling row
+        and a traceback matrix of 2 bits per cell packed into uint8 (4 cells per byte),
+        the directions are stored with the same priority as nw_basic (diagonal, upper, left)
+        -> about 1/32 of the memory of the float64 score matrix of nw_basic
+        match, mismatch and gap must be integers
+        :returns: tuple (seqX, seqY, score) like nw_basic"""
+    x, y = str(x), str(y)
+    n, m = len(x), len(y)
+    width = (m + 3) // 4
+    trace = np.zeros((n, width), dtype=np.uint8) # packed directions of the cells (i+1, j+1)
+    prev = -np.arange(m+1, dtype=np.int32) * np.int32(gap)
+    row = np.empty(m+1, dtype=np.int32)
+    dirs = np.zeros(width * 4, dtype=np.uint8)
+    not_diag = np.zeros(width * 4, dtype=np.uint8)
+    ramp = np.arange(m+1, dtype=np.int32) * np.int32(gap)
+    if n == 0 or m == 0:
+        n_rows = 0 # nothing to fill, only gaps
+    else:
+        n_rows = n
+        profile, rows = substitution_profile(x, y, match, mismatch)
+        profile = profile.astype(np.int32)
+    for i in range(n_rows):
+        diag = prev[:-1] + profile[rows[i]]
+        up = prev[1:] - np.int32(gap)
+        row[0] = -(i+1) * gap
+        np.maximum(diag, up, out=row[1:])
+        # left gaps by prefix maximum like nw_fill
+        row += ramp
+        np.maximum.accumulate(row, out=row)
+        row -= ramp
+        cells = row[1:]
+        # 0 = diagonal, 1 = upper, 2 = left
+        np.not_equal(cells, diag, out=not_diag[:m])
+        np.logical_and(not_diag[:m], cells != up, out=dirs[:m].view(bool))
+        dirs += not_diag
+        packed = dirs.reshape(-1, 4)
+        trace[i] = packed[:, 0] | (packed[:, 1] << 2) | (packed[:, 2] << 4) | (packed[:, 3] << 6)
+        prev, row = row, prev
+    score = int(prev[m]) if n_rows else -(n + m) * gap
+
+    return _traceback(x, y, lambda i, j: (trace[i-1, (j-1) >> 2] >> (((j-1) & 3) << 1)) & 3) + (score,)
+
+
+def _traceback(x, y, direction):
+    """Traceback from the lower right corner to the upper left
+        :param direction: function (i, j) -> DIAG, UP or LEFT for the cells with i, j > 0
+        :returns: tuple (seqX, seqY)"""
+    seqX = []
+    seqY = []
+    i = len(x)
+    j = len(y)
+    while i > 0 and j > 0:
+        d = direction(i, j)
+        if d == DIAG:
+            seqX.append(x[i-1])
+            seqY.append(y[j-1])
+            i -= 1
+            j -= 1
+        elif d == UP:
+            seqX.append(x[i-1])
+            seqY.append('-')
+            i -= 1
+        else:
+            seqX.append('-')
+            seqY.append(y[j-1])
+            j -= 1
+    # in case of left chars after i or j == 0
+    seqX.extend(x[i-1::-1] if i else "")
+    seqY.extend('-' * i)
+    seqX.extend('-' * j)
+    seqY.extend(y[j-1::-1] if j else "")
+    return "".join(reversed(seqX)), "".join(reversed(seqY))
+
+
+def _directions(cells, diag, up):
+    """traceback directions of a row with the priority of nw_basic: diagonal, upper, left"""
+    return np.where(cells == diag, DIAG, np.where(cells == up, UP, LEFT)).astype(np.uint8)
+
+
+ADAPTIVE_BAND = 16 # start width of the adaptive band
+
+
+def _nw_band(x, y, lo, hi, match, mismatch, gap):
+    """Needleman-Wunsch restricted to the diagonals lo <= j - i <= hi, lo <= min(0, m-n), hi >= max(0, m-n)
+        the band of row i is stored in a row of width hi - lo + 1, column k holds cell j = i + lo + k
+        :returns: tuple (seqX, seqY, score)"""
     n, m = len(x), len(y)
-    mat = []
-    # init matrix
-    for i in range(n+1):
-        mat.append([0]*(m+1))
-    # Initialization
-    for j in range(m+1):
-        mat[0][j] = -gap_penalty*j
+    width = hi - lo + 1
+    xb = np.frombuffer(x.encode("latin-1"), dtype=np.uint8)
+    yb = np.frombuffer(y.encode("latin-1"), dtype=np.uint8)
+    trace = np.full((n+1, width), LEFT, dtype=np.uint8)
+    ramp = np.arange(width) * gap
+    # row 0, out of band and out of matrix cells are -inf, the extra last cell is the upper neighbour of k = width-1
+    prev = np.full(width+1, -np.inf)
+    j0, j1 = max(0, lo), min(m, hi)
+    prev[j0-lo:j1-lo+1] = -np.arange(j0, j1+1) * float(gap)
+    row = np.empty(width+1)
     for i in range(1, n+1):
-        mat[i][0] = -gap_penalty*i
-        # Recursion
-        for j in range(1, m+1):
-            if x[n-i] == y[m-j]:
-                mat[i][j] = max(mat[i-1][j-1] + match_score,
-                            mat[i-1][j] - gap_penalty,
-                            mat[i][j-1] - gap_penalty)
-            else:
-                mat[i][j] = max(mat[i - 1][j - 1] + mismatch_score,
-                                mat[i - 1][j] - gap_penalty,
-                                mat[i][j - 1] - gap_penalty)
-        # Now clear row from memory.
-        mat[i-1] = []
-    return mat[n]
-
-
-def nw_linear_space(x, y):
-    """Needleman-Wunsch algorithm using only linear space, also called the Hirschberg algorithm"""
-    # This is the main Hirschberg routine.
+        row.fill(-np.inf)
+        j0, j1 = max(0, i+lo), min(m, i+hi) # cells of row i within the band
+        k0, k1 = j0-i-lo, j1-i-lo
+        up = prev[k0+1:k1+2] - gap
+        diag = np.full(k1-k0+1, -np.inf)
+        d0 = 1 if j0 == 0 else 0 # cell (i, 0) has no diagonal neighbour
+        diag[d0:] = prev[k0+d0:k1+1] + np.where(yb[j0+d0-1:j1] == xb[i-1], float(match), float(mismatch))
+        cells = row[k0:k1+1]
+        np.maximum(diag, up, out=cells)
+        # left gaps by prefix maximum like nw_fill
+        r = ramp[:k1-k0+1]
+        cells += r
+        np.maximum.accumulate(cells, out=cells)
+        cells -= r
+        trace[i, k0:k1+1] = _directions(cells, diag, up)
+        prev, row = row, prev
+    score = prev[m-n-lo]
+    seqX, seqY = _traceback(x, y, lambda i, j: trace[i, j-i-lo])
+    return seqX, seqY, score
+
+
+def _band_bound(n, m, lo, hi, match, mismatch, gap):
+    """Upper bound of the score of all alignments leaving the diagonals lo..hi.
+        Such an alignment touches diagonal lo-1 or hi+1 and therefore needs at least g = |d| + |m-n-d| gaps,
+        with p = (n+m-g)/2 aligned pairs its score is at most p * max(match, mismatch) - g * gap
+        :returns: the bound, inf if no bound can be given"""
+    best = max(match, mismatch)
+    if best / 2 + gap < 0: # bound does not fall with more gaps -> no pruning possible
+        return np.inf
+    bound = -np.inf
+    for d in (lo-1, hi+1):
+        if -n <= d <= m:
+            g = abs(d) + abs(m-n-d)
+            bound = max(bound, (n+m-g) / 2 * best - g * gap)
+    return bound
+
+
+def nw_banded(x, y, match=1, mismatch=-1, gap=1, band=None):
+    """Global alignment restricted to a band around the diagonals from (0, 0) to (n, m)
+        -> time and memory O(n * w) instead of O(n * m)
+        :param band: fixed band width w, the result is the best alignment within the band and may not be optimal,
+        if None the band starts with ADAPTIVE_BAND and is doubled until its score is at least the upper bound
+        of all alignments leaving the band (_band_bound), then it is the optimal score
+        :returns: tuple (seqX, seqY, score) like nw_basic"""
+    x, y = str(x), str(y)
     n, m = len(x), len(y)
-    if n<2 or m<2:
-        # In this case we just use the N-W algorithm.
-        return nw_basic(x, y)
-    else:
-        # Make partitions, call subroutines.
-        nr = int(np.round(n/2, 0))
-        F, B = halved_score(x[:nr], y), halved_score(x[nr:], y)
-        partition = [F[j] + B[m-j] for j in range(m+1)]
-        cut = partition.index(max(partition))
-        print(cut)
-        # Clear all memory now, so that we don't store data during recursive calls.
-        F, B, partition = [], [], []
-        # Now make recursive calls.
-        call_left = nw_linear_space(x[0:nr], y[0:cut])
-        call_right = nw_linear_space(x[nr:], y[cut:])
-        # Return result in format: [1st alignment, 2nd alignment, similarity]
-        return [call_left[r] + call_right[r] for r in range(3)]
-
-gap_penalty = 1
+    w = ADAPTIVE_BAND if band is None else band
+    while True:
+        lo, hi = min(0, m-n) - w, max(0, m-n) + w
+        lo, hi = max(lo, -n), min(hi, m)
+        sltn = _nw_band(x, y, lo, hi, match, mismatch, gap)
+        if band is not None or (lo == -n and hi == m) or \
+                sltn[2] >= _band_bound(n, m, lo, hi, match, mismatch, gap):
+            return sltn
+        w = max(2 * w, 1)
 
-"""Task 03"""
-def computeF (i, j, c1, c2):
-    """calculates an entry of F recursively"""
-    if i==0 and j==0:
-        return 0
-    elif i==0:
-        return -j*gap_penalty
-    elif j==0:
-        return -i*gap_penalty
-    else:
-        return max(computeF(i-1, j-1, c1, c2) + is_match(c1,c2),
-                   computeF(i-1, j, c1, c2) - gap_penalty,
-                   computeF(i, j-1, c1, c2) - gap_penalty)
 
-def nw_wo_table(x, y):
-    """calculates all entries in a matrix for an optimal global alignment recursively
-    :returns the score"""
+def nw_xdrop(x, y, match=1, mismatch=-1, gap=1, xdrop=20):
+    """Global alignment with X-drop pruning: cells more than xdrop below the best score seen so far are dropped,
+        every row is only computed between its first and last live cell (+1 for the diagonal, + left gaps)
+        -> for similar sequences only a narrow region around the optimal path is filled,
+        heuristic: the result may not be optimal if the optimal path drops more than xdrop below the best score
+        :raises ValueError: if the cell (n, m) was pruned
+        :returns: tuple (seqX, seqY, score) like nw_basic"""
+    x, y = str(x), str(y)
+    n, m = len(x), len(y)
+    xb = np.frombuffer(x.encode("latin-1"), dtype=np.uint8)
+    yb = np.frombuffer(y.encode("latin-1"), dtype=np.uint8)
+    best = 0.0
+    # row 0: only the cells within xdrop of F(0, 0)
+    j1 = m if gap <= 0 else min(m, int(xdrop // gap))
+    prev = -np.arange(j1+1) * float(gap)
+    plo = 0 # first cell of prev
+    windows = [(0, np.full(j1+1, LEFT, dtype=np.uint8))] # (first cell, directions) of every row
+    for i in range(1, n+1):
+        phi = plo + len(prev) - 1
+        j0, j1 = plo, min(m, phi+1)
+        up = np.full(j1-j0+1, -np.inf)
+        up[:phi-j0+1] = prev[:phi-j0+1] - gap
+        diag = np.full(j1-j0+1, -np.inf)
+        # the first cell has no diagonal neighbour in prev
+        diag[1:] = prev[:j1-j0] + np.where(yb[j0:j1] == xb[i-1], float(match), float(mismatch))
+        cells = np.maximum(diag, up)
+        r = np.arange(len(cells)) * gap
+        cells += r
+        np.maximum.accumulate(cells, out=cells)
+        cells -= r
+        dirs = _directions(cells, diag, up)
+        # extend to the right with left gaps while above the drop-off
+        if j1 < m and np.isfinite(cells[-1]):
+            ext = m - j1 if gap <= 0 else min(m - j1, int((cells[-1] - best + xdrop) // gap))
+            if ext > 0:
+                cells = np.concatenate((cells, cells[-1] - np.arange(1, ext+1) * gap))
+                dirs = np.concatenate((dirs, np.full(ext, LEFT, dtype=np.uint8)))
+        best = max(best, cells.max())
+        live = np.flatnonzero(cells >= best - xdrop)
+        if len(live) == 0:
+            raise ValueError("X-drop pruned all cells of row {}, increase xdrop.".format(i))
+        first, last = live[0], live[-1]
+        cells = cells[first:last+1]
+        cells[cells < best - xdrop] = -np.inf
+        windows.append((j0 + first, dirs[first:last+1]))
+        prev, plo = cells, j0 + first
+    if not plo <= m < plo + len(prev) or not np.isfinite(prev[m-plo]):
+        raise ValueError("X-drop pruned the end of the alignment, increase xdrop.")
+    score = prev[m-plo]
+    seqX, seqY = _traceback(x, y, lambda i, j: windows[i][1][j - windows[i][0]])
+    return seqX, seqY, score
+
+
+"""Task 02"""
+BASE_CELLS = 1 << 16 # subproblems up to this size are aligned with the full table
+
+
+def nw_score_row(x, y, match=1, mismatch=-1, gap=1):
+    """calculates the last row F(n, j) of the score matrix with two rolling rows
+    :returns: float array of length m+1"""
     n, m = len(x), len(y)
-    # Initialization
+    prev = -np.arange(m+1) * float(gap)
+    if n == 0:
+        return prev
+    row = np.empty(m+1)
+    ramp = np.arange(m+1) * gap
+    profile, rows = substitution_profile(x, y, match, mismatch)
     for i in range(n):
-        for j in range(m):
-            s = computeF(i, j, x[i], y[j])
-    return s
\ No newline at end of file
+        row[0] = -(i+1) * gap
+        _next_row(prev, row, profile[rows[i]], gap, ramp)
+        prev, row = row, prev
+    return prev
+
+
+def nw_linear_space(x, y, match=1, mismatch=-1, gap=1):
+    """Needleman-Wunsch algorithm using only linear space, also called the Hirschberg algorithm:
+        x is halved, the last rows of the forward scores of the upper half and of the backward scores
+        (reversed sequences) of the lower half give the optimal cut of y, both halves are solved independently.
+        Subproblems are kept on an explicit stack, small ones (<= BASE_CELLS) are solved with nw_basic.
+        :returns: tuple (seqX, seqY, score) like nw_basic"""
+    x, y = str(x), str(y)
+    partsX, partsY = [], []
+    score = 0
+    stack = [(0, len(x), 0, len(y))]
+    while stack:
+        x0, x1, y0, y1 = stack.pop()
+        n, m = x1 - x0, y1 - y0
+        if n <= 1 or m == 0 or n * m <= BASE_CELLS:
+            sltn = nw_basic(x[x0:x1], y[y0:y1], match, mismatch, gap)
+            partsX.append(sltn[0])
+            partsY.append(sltn[1])
+            score += sltn[2]
+            continue
+        mid = x0 + n // 2
+        F = nw_score_row(x[x0:mid], y[y0:y1], match, mismatch, gap)
+        B = nw_score_row(x[mid:x1][::-1], y[y0:y1][::-1], match, mismatch, gap)
+        cut = y0 + int(np.argmax(F + B[::-1]))
+        # right half is pushed first -> the left half is solved (and appended) first
+        stack.append((mid, x1, cut, y1))
+        stack.append((x0, mid, y0, cut))
+    return ("".join(partsX), "".join(partsY), score)
+
+
+"""parallel Hirschberg"""
+PARALLEL_CELLS = 1 << 26 # subproblems up to this size are aligned by one process
+PIPELINE_ROWS = 1024 # rows per message between the column blocks of a pipelined pass
+_x = _y = None # sequences of a worker process
+
+
+def _init_worker(x, y):
+    """sends the sequences once per worker process"""
+    global _x, _y
+    _x, _y = x, y
+
+
+def _half_row(x0, x1, y0, y1, backward, match, mismatch, gap):
+    """forward pass over x[x0:x1] resp. backward pass (reversed sequences) in a worker process"""
+    if backward:
+        return nw_score_row(_x[x0:x1][::-1], _y[y0:y1][::-1], match, mismatch, gap)
+    return nw_score_row(_x[x0:x1], _y[y0:y1], match, mismatch, gap)
+
+
+def _solve(x0, x1, y0, y1, match, mismatch, gap):
+    """aligns a subproblem with nw_linear_space in a worker process"""
+    return nw_linear_space(_x[x0:x1], _y[y0:y1], match, mismatch, gap)
+
+
+def _block_row(x, y, j0, j1, left, right, result, match, mismatch, gap):
+    """columns j0..j1 of nw_score_row(x, y) in its own process: column j0 is received from the block to the left,
+    column j1 is sent to the block to the right, both in messages of PIPELINE_ROWS rows (None at the edges).
+    The last row (without column j0 if there is a block to the left) is sent to result."""
+    n = len(x)
+    prev = -np.arange(j0, j1+1) * float(gap)
+    row = np.empty(j1-j0+1)
+    ramp = np.arange(j1-j0+1) * gap
+    profile, rows = substitution_profile(x, y[j0:j1], match, mismatch)
+    col = out = None
+    for i in range(n):
+        k = i % PIPELINE_ROWS
+        if left is not None and k == 0:
+            col = left.recv()
+        row[0] = col[k] if left is not None else -(i+1) * gap
+        _next_row(prev, row, profile[rows[i]], gap, ramp)
+        if right is not None:
+            if k == 0:
+                out = np.empty(min(PIPELINE_ROWS, n-i))
+            out[k] = row[-1]
+            if k == len(out) - 1:
+                right.send(out)
+        prev, row = row, prev
+    result.send(prev if left is None else prev[1:])
+
+
+def _start_pipeline(x, y, blocks, match, mismatch, gap):
+    """starts nw_score_row(x, y) as a wavefront of column blocks on separate processes
+    :returns: tuple (processes, result connections in column order)"""
+    m = len(y)
+    bounds = [m * b // blocks for b in range(blocks+1)]
+    procs, results = [], []
+    left = None
+    for b in range(blocks):
+        right_in, right = mp.Pipe(duplex=False) if b < blocks - 1 else (None, None)
+        result_in, result = mp.Pipe(duplex=False)
+        procs.append(mp.Process(target=_block_row, args=(x, y, bounds[b], bounds[b+1], left, right, result,
+                                                          match, mismatch, gap), daemon=True))
+        results.append(result_in)
+        left = right_in
+    for proc in procs:
+        proc.start()
+    return procs, results
+
+
+def _collect(rows):
+    """last row of a pass, either a future of the pool or a started pipeline"""
+    if not isinstance(rows, tuple):
+        return rows.result()
+    procs, results = rows
+    row = np.concatenate([r.recv() for r in results])
+    for proc in procs:
+        proc.join()
+    return row
+
+
+def nw_linear_space_parallel(x, y, match=1, mismatch=-1, gap=1, processes=None, threshold=PARALLEL_CELLS):
+    """Hirschberg algorithm on several processes: the recursion is unrolled level by level,
+        all subproblems of a level larger than threshold are split at once, their forward and backward passes
+        run concurrently. While there are fewer passes than processes every pass is itself split into column
+        blocks on separate processes that hand the boundary column to the right (wavefront), afterwards the passes
+        run on a process pool. Once there are 4 subproblems per process (or none is larger than threshold)
+        they are aligned on the pool with nw_linear_space, largest first. Memory stays linear in n + m.
+        :param processes: number of processes, default number of CPUs
+        :returns: tuple (seqX, seqY, score) like nw_basic"""
+    x, y = str(x), str(y)
+    processes = processes or os.cpu_count() or 1
+    subs = [(0, len(x), 0, len(y))]
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(x, y)) as pool:
+        while True:
+            large = [s for s in subs if s[1] - s[0] > 1 and s[3] > s[2] and (s[1] - s[0]) * (s[3] - s[2]) > threshold]
+            if not large or len(large) >= 4 * processes:
+                break
+            blocks = processes // (2 * len(large))
+            rows = []
+            for x0, x1, y0, y1 in large:
+                mid = x0 + (x1 - x0) // 2
+                if blocks > 1:
+                    rows.append(_start_pipeline(x[x0:mid], y[y0:y1], min(blocks, y1-y0), match, mismatch, gap))
+                    rows.append(_start_pipeline(x[mid:x1][::-1], y[y0:y1][::-1], min(blocks, y1-y0),
+                                                match, mismatch, gap))
+                else:
+                    rows.append(pool.submit(_half_row, x0, mid, y0, y1, False, match, mismatch, gap))
+                    rows.append(pool.submit(_half_row, mid, x1, y0, y1, True, match, mismatch, gap))
+            halves = {}
+            for k, (x0, x1, y0, y1) in enumerate(large):
+                F, B = (_collect(r) for r in rows[2*k:2*k+2])
+                mid = x0 + (x1 - x0) // 2
+                cut = y0 + int(np.argmax(F + B[::-1]))
+                halves[x0, y0] = [(x0, mid, y0, cut), (mid, x1, cut, y1)]
+            subs = [h for s in subs for h in halves.get(s[:3:2], [s])]
+        order = sorted(range(len(subs)), key=lambda k: -(subs[k][1] - subs[k][0]) * (subs[k][3] - subs[k][2]))
+        jobs = {k: pool.submit(_solve, *subs[k], match, mismatch, gap) for k in order}
+        sltns = [jobs[k].result() for k in range(len(subs))]
+    return ("".join(s[0] for s in sltns), "".join(s[1] for s in sltns), sum(s[2] for s in sltns))
+
+
+"""Task 03"""
+def nw_wo_table(x, y, match=1, mismatch=-1, gap=1):
+    """calculates the optimal global alignment score without a table:
+    only two rows of the score matrix are kept (nw_score_row), the rows run along the shorter sequence
+    -> O(min(n, m)) memory, the score is symmetric in x and y
+    :returns the score"""
+    x, y = str(x), str(y)
+    if len(y) > len(x):
+        x, y = y, x
+    return nw_score_row(x, y, match, mismatch, gap)[-1]
+
+
+"""bit-parallel score"""
+def _peq(s):
+    """bit mask of the positions of each char in s"""
+    peq = {}
+    for i, c in enumerate(s):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    return peq
+
+
+def levenshtein(x, y):
+    """edit distance of x and y with the bit-vector algorithm of Myers / Hyyroe:
+    one column of the DP matrix is stored as bits of Python ints, which grow to any number of 64 bit words,
+    each char of the longer sequence updates the whole column at once"""
+    if len(x) < len(y): # pattern = shorter sequence -> fewer bits
+        x, y = y, x
+    m = len(y)
+    if m == 0:
+        return len(x)
+    peq = _peq(y)
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    vp, vn = mask, 0 # vertical deltas +1 / -1 of the current column
+    score = m
+    for c in x:
+        eq = peq.get(c, 0)
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        ph = vn | ~(xh | vp) # horizontal deltas +1 / -1
+        mh = vp & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask # global alignment -> top row increases by 1 per column
+        mh = (mh << 1) & mask
+        vp = (mh | ~(xv | ph)) & mask
+        vn = ph & xv
+    return score
+
+
+def lcs_length(x, y):
+    """length of the longest common subsequence with the bit-vector algorithm of Allison-Dix / Hyyroe"""
+    if len(x) < len(y):
+        x, y = y, x
+    m = len(y)
+    peq = _peq(y)
+    mask = (1 << m) - 1
+    v = mask # zero bits mark the matches of the current LCS column
+    for c in x:
+        u = v & peq.get(c, 0)
+        v = ((v + u) | (v - u)) & mask
+    return m - bin(v).count("1")
+
+
+def nw_score_bounds(x, y, match=1, mismatch=-1, gap=1):
+    """Global alignment score from bit-parallel edit distance and LCS.
+    With p pairs, s of them mismatches, and g gaps (n + m = 2p + g) the score is
+        match * (n+m)/2 - (match - mismatch) * s - (match/2 + gap) * g
+    so maximising it minimises the weighted edit cost w_s * s + w_g * g. Every alignment has
+    g >= |n-m|, s + g >= levenshtein and 2s + g >= n + m - 2 lcs; the cost is bounded from below by the
+    minimum of these constraints and from above by the cost of the edit distance and of the LCS alignment.
+    The bounds are equal, i.e. the score is exact, if w_s == w_g (unit cost) or w_s >= 2 w_g (LCS).
+    :returns: tuple (lower, upper) of the optimal score"""
+    x, y = str(x), str(y)
+    w_s, w_g = match - mismatch, match / 2 + gap
+    if w_s < 0 or w_g < 0:
+        raise ValueError("Bit-parallel scoring needs match >= mismatch and gap >= -match/2.")
+    n, m = len(x), len(y)
+    a = abs(n - m)
+    d = levenshtein(x, y)
+    if w_s == w_g:
+        return (match * (n + m) / 2 - w_g * d,) * 2
+    ind = n + m - 2 * lcs_length(x, y) # indel distance, mismatches count as 2 gaps
+    # minimum of w_s * s + w_g * g over the vertices of {g >= a, s + g >= d, 2s + g >= ind, s >= 0}
+    vertices = [(0, max(a, d, ind)), (max(d - a, (ind - a + 1) // 2, 0), a), (ind - d, 2 * d - ind)]
+    low = min(w_s * s + w_g * g for s, g in vertices
+              if s >= 0 and g >= a and s + g >= d and 2 * s + g >= ind)
+    # edit distance alignment has s + g = d and g >= a, the LCS alignment has no mismatches
+    high = min(max(w_s, w_g) * (d - a) + w_g * a, w_g * ind)
+    return match * (n + m) / 2 - high, match * (n + m) / 2 - low
+
+
+
+def _propagate(gen, run, mask):
+    """P[i] = gen[i] | (run[i] & P[i-1]) for all bits at once: a start bit inside a run of ones carries through
+    the run like the carry of an addition"""
+    start = run & (gen | (gen << 1))
+    return (gen | start | (run & ((run + start) ^ run ^ start))) & mask
+
+
+def nw_score_bits(x, y, match=1, mismatch=-1, gap=1):
+    """Exact global alignment score for integer scores with bit-parallel difference vectors (like BitPAl).
+    The vertical and horizontal differences V(i,j) = S(i,j) - S(i-1,j), H(i,j) = S(i,j) - S(i,j-1)
+    only take the values -gap..top with top = max(match, mismatch) + gap. A column of differences is stored as
+    one bit vector per threshold t (bit i set <=> difference >= t), the vectors run along the longer sequence.
+    Per char of the shorter sequence:
+        H(i,j) = max(s - V(i,j-1), H(i-1,j) - V(i,j-1) - gap, -gap)
+        V(i,j) = max(s - H(i-1,j), V(i,j-1) - H(i-1,j) - gap, -gap)
+    H depends on the row above, "H >= t" is carried down through the rows with V(i,j-1) = -gap by _propagate,
+    rows with a larger V pass it on to a lower threshold. The score is S(0,m) + sum of V(i,m).
+    :returns: the score
+    :raises ValueError: if the scores are not integers or gap < 0"""
+    x, y = str(x), str(y)
+    if any(v != int(v) for v in (match, mismatch, gap)) or gap < 0:
+        raise ValueError("Bit-parallel difference vectors need integer scores and gap >= 0.")
+    match, mismatch, gap = int(match), int(mismatch), int(gap)
+    if len(x) < len(y): # vectors along the longer sequence -> fewer big int operations
+        x, y = y, x
+    n = len(x)
+    if n == 0 or len(y) == 0:
+        return -gap * (n + len(y))
+    low, top = -gap, max(match, mismatch, -gap) + gap
+    levels = range(low + 1, top + 1)
+    mask = (1 << n) - 1
+    peq = _peq(x)
+
+    def at_least(ge, t):
+        """bit vector of difference >= t, ge[t] holds the thresholds low+1..top"""
+        return mask if t <= low else ge[t] if t <= top else 0
+
+    def equal(ge, v):
+        return at_least(ge, v) & ~at_least(ge, v + 1) & mask
+
+    v_ge = {t: 0 for t in levels} # V(i,0) = -gap
+    for c in y:
+        eq = peq.get(c, 0)
+        v_eq = {v: equal(v_ge, v) for v in range(low, top + 1)}
+        h_ge = {}
+        for t in reversed(levels): # H >= t needs the higher thresholds of the row above
+            gen = (eq & ~at_least(v_ge, match - t + 1) | ~eq & ~at_least(v_ge, mismatch - t + 1)) & mask
+            for v in range(low + 1, top + 1):
+                if t + v + gap <= top:
+                    gen |= v_eq[v] & (h_ge[t + v + gap] << 1)
+            h_ge[t] = _propagate(gen & mask, v_eq[low], mask)
+        hp_ge = {t: (h_ge[t] << 1) & mask for t in levels} # H(i-1,j), H(0,j) = -gap
+        hp_eq = {h: equal(hp_ge, h) for h in range(low, top + 1)}
+        new = {}
+        for t in levels:
+            ge = (eq & ~at_least(hp_ge, match - t + 1) | ~eq & ~at_least(hp_ge, mismatch - t + 1)) & mask
+            for h in range(low, top + 1):
+                ge |= hp_eq[h] & at_least(v_ge, t + gap + h)
+            new[t] = ge
+        v_ge = new
+    return -gap * (len(y) + n) + sum(bin(v_ge[t]).count("1") for t in levels)
@@ -0,0 +1,217 @@
+""" 2-bit packed nucleotide sequences
+    :classes: PackedSequence
+    :functions: pack_records(records)"""
+import numpy as np
+
+BASES = b"ACGT"
+# ASCII -> 2-bit code, A = 0, C = 1, G = 2, T = 3, complement of a code c is c ^ 3
+ENCODE = np.full(256, 255, dtype=np.uint8)
+for code, base in enumerate(BASES):
+    ENCODE[base] = code
+    ENCODE[ord(chr(base).lower())] = code
+DECODE = np.frombuffer(BASES, dtype=np.uint8)
+# complement of ambiguous IUPAC chars, everything else is kept as is
+COMPLEMENT = np.arange(256, dtype=np.uint8)
+for a, b in zip(b"RYKMBVDHrykmbvdh", b"YRMKVBHDyrmkvbhd"):
+    COMPLEMENT[a] = b
+SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+
+class PackedSequence:
+    """
+    Nucleotide sequence with 2 bits per base, 4 bases per byte in a uint8 array.
+    Chars other than ACGT (N, IUPAC codes, ...) are stored with code 0 and listed in a sorted
+    side mask of positions and chars. Lower case acgt are stored as upper case bases.
+    Slicing with step 1 returns a view sharing the packed array and the mask.
+    """
+    def __init__(self, data: np.ndarray, length: int, start: int = 0,
+                 mask_pos: np.ndarray = None, mask_chr: np.ndarray = None):
+        self.data = data # packed bases
+        self.length = length # number of bases
+        self.start = start # position of the first base within data
+        # positions within data and chars of all non ACGT bases
+        self.mask_pos = mask_pos if mask_pos is not None else np.empty(0, dtype=np.int64)
+        self.mask_chr = mask_chr if mask_chr is not None else np.empty(0, dtype=np.uint8)
+
+    @classmethod
+    def from_str(cls, seq):
+        """
+        Packs a sequence.
+        :param seq: str or bytes
+        :return: PackedSequence
+        """
+        if isinstance(seq, str):
+            seq = seq.encode("latin-1")
+        chars = np.frombuffer(seq, dtype=np.uint8)
+        codes = ENCODE[chars]
+        ambiguous = codes == 255
+        mask_pos = np.flatnonzero(ambiguous)
+        mask_chr = chars[mask_pos]
+        codes[ambiguous] = 0
+        return cls.from_codes(codes, mask_pos, mask_chr)
+
+    @classmethod
+    def from_codes(cls, codes: np.ndarray, mask_pos: np.ndarray = None, mask_chr: np.ndarray = None):
+        """
+        Packs an array of 2-bit codes.
+        :param codes: uint8 array with values 0-3
+        :param mask_pos: sorted positions of non ACGT chars
+        :param mask_chr: chars at mask_pos
+        :return: PackedSequence
+        """
+        length = len(codes)
+        padded = np.zeros((length + 3) // 4 * 4, dtype=np.uint8)
+        padded[:length] = codes
+        data = np.bitwise_or.reduce(padded.reshape(-1, 4) << SHIFTS, axis=1).astype(np.uint8)
+        return cls(data, length, 0, mask_pos, mask_chr)
+
+    def _mask_range(self):
+        """indices of the mask entries that lie within this (view of the) sequence"""
+        lo = np.searchsorted(self.mask_pos, self.start)
+        hi = np.searchsorted(self.mask_pos, self.start + self.length)
+        return lo, hi
+
+    def codes(self):
+        """
+        Unpacks the bases of this sequence.
+        :return: uint8 array of 2-bit codes, non ACGT chars have code 0
+        """
+        first = self.start // 4
+        last = (self.start + self.length + 3) // 4
+        unpacked = ((self.data[first:last, None] >> SHIFTS) & 3).ravel()
+        offset = self.start - 4 * first
+        return unpacked[offset:offset + self.length]
+
+    def ambiguous(self):
+        """
+        :return: (positions, chars) of all non ACGT chars relative to the start of this sequence
+        """
+        lo, hi = self._mask_range()
+        return self.mask_pos[lo:hi] - self.start, self.mask_chr[lo:hi]
+
+    def to_bytes(self):
+        """
+        :return: sequence as bytes
+        """
+        chars = DECODE[self.codes()]
+        pos, chrs = self.ambiguous()
+        chars[pos] = chrs
+        return chars.tobytes()
+
+    def __str__(self):
+        return self.to_bytes().decode("latin-1")
+
+    def __repr__(self):
+        return "PackedSequence('{}')".format(self)
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def nbytes(self):
+        """memory used by the packed bases and the mask"""
+        return self.data.nbytes + self.mask_pos.nbytes + self.mask_chr.nbytes
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.length)
+            if step != 1:
+                return PackedSequence.from_str(str(self)[key])
+            stop = max(start, stop)
+            return PackedSequence(self.data, stop - start, self.start + start, self.mask_pos, self.mask_chr)
+        if key < 0:
+            key += self.length
+        if not 0 <= key < self.length:
+            raise IndexError("PackedSequence index out of range")
+        pos = self.start + key
+        if len(self.mask_pos):
+            idx = np.searchsorted(self.mask_pos, pos)
+            if idx < len(self.mask_pos) and self.mask_pos[idx] == pos:
+                return chr(self.mask_chr[idx])
+        return "ACGT"[(self.data[pos >> 2] >> ((pos & 3) << 1)) & 3]
+
+    def __eq__(self, other):
+        if isinstance(other, (str, PackedSequence)):
+            return len(self) == len(other) and str(self) == str(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __add__(self, other):
+        if isinstance(other, str):
+            other = PackedSequence.from_str(other)
+        if not isinstance(other, PackedSequence):
+            return NotImplemented
+        pos1, chr1 = self.ambiguous()
+        pos2, chr2 = other.ambiguous()
+        return PackedSequence.from_codes(np.concatenate((self.codes(), other.codes())),
+                                         np.concatenate((pos1, pos2 + len(self))),
+                                         np.concatenate((chr1, chr2)))
+
+    def __radd__(self, other):
+        if isinstance(other, str):
+            return PackedSequence.from_str(other) + self
+        return NotImplemented
+
+    def reverse_complement(self):
+        """
+        :return: reverse complement as new PackedSequence
+        """
+        pos, chrs = self.ambiguous()
+        return PackedSequence.from_codes(self.codes()[::-1] ^ 3,
+                                         (self.length - 1 - pos)[::-1],
+                                         COMPLEMENT[chrs][::-1])
+
+    def kmer_codes(self, k: int):
+        """
+        Encodes all k-mers without ambiguous chars as integers (2 bits per base, k <= 32).
+        :param k: k-mer size
+        :return: uint64 array of k-mer codes in order of their position
+        """
+        if k > 32:
+            raise ValueError("k-mer size must be <= 32, got {}.".format(k))
+        n = self.length - k + 1
+        if n <= 0:
+            return np.empty(0, dtype=np.uint64)
+        codes = self.codes().astype(np.uint64)
+        kmers = np.zeros(n, dtype=np.uint64)
+        for j in range(k): # shift in one base of every k-mer at a time
+            kmers = (kmers << np.uint64(2)) | codes[j:j + n]
+        pos, chrs = self.ambiguous()
+        if len(pos):
+            count = np.zeros(self.length + 1, dtype=np.int64)
+            count[pos + 1] = 1
+            count = np.cumsum(count) # number of ambiguous chars in front of each position
+            kmers = kmers[count[k:] == count[:n]]
+        return kmers
+
+    def common_prefix_length(self, other: "PackedSequence"):
+        """
+        Length of the common prefix of two packed sequences, compares growing blocks vectorised.
+        :param other: PackedSequence
+        :return: int common prefix length
+        """
+        n = min(len(self), len(other))
+        done = 0
+        block = 32
+        while done < n:
+            end = min(n, done + block)
+            a = np.frombuffer(self[done:end].to_bytes(), dtype=np.uint8)
+            b = np.frombuffer(other[done:end].to_bytes(), dtype=np.uint8)
+            diff = np.flatnonzero(a != b)
+            if len(diff):
+                return done + int(diff[0])
+            done = end
+            block *= 2
+        return n
+
+
+def pack_records(records):
+    """
+    Packs the sequences of fasta records, e.g. from fasta.iter_records.
+    :param records: iterable of tuples (header, sequence)
+    :return: generator of tuples (header, PackedSequence)
+    """
+    for head, seq in records:
+        yield head, PackedSequence.from_str(seq)
@@ -0,0 +1,152 @@
+""" Substitution matrices and affine gap costs
+    :classes: Scoring
+    :functions: read_matrix(path)"""
+import numpy as np
+
+"""BLOSUM62 in NCBI format"""
+BLOSUM62 = """
+   A  R  N  D  C  Q  E  G  H  I  L  K  M  F  P  S  T  W  Y  V  B  Z  X  *
+A  4 -1 -2 -2  0 -1 -1  0 -2 -1 -1 -1 -1 -2 -1  1  0 -3 -2  0 -2 -1  0 -4
+R -1  5  0 -2 -3  1  0 -2  0 -3 -2  2 -1 -3 -2 -1 -1 -3 -2 -3 -1  0 -1 -4
+N -2  0  6  1 -3  0  0  0  1 -3 -3  0 -2 -3 -2  1  0 -4 -2 -3  3  0 -1 -4
+D -2 -2  1  6 -3  0  2 -1 -1 -3 -4 -1 -3 -3 -1  0 -1 -4 -3 -3  4  1 -1 -4
+C  0 -3 -3 -3  9 -3 -4 -3 -3 -1 -1 -3 -1 -2 -3 -1 -1 -2 -2 -1 -3 -3 -2 -4
+Q -1  1  0  0 -3  5  2 -2  0 -3 -2  1  0 -3 -1  0 -1 -2 -1 -2  0  3 -1 -4
+E -1  0  0  2 -4  2  5 -2  0 -3 -3  1 -2 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+G  0 -2  0 -1 -3 -2 -2  6 -2 -4 -4 -2 -3 -3 -2  0 -2 -2 -3 -3 -1 -2 -1 -4
+H -2  0  1 -1 -3  0  0 -2  8 -3 -3 -1 -2 -1 -2 -1 -2 -2  2 -3  0  0 -1 -4
+I -1 -3 -3 -3 -1 -3 -3 -4 -3  4  2 -3  1  0 -3 -2 -1 -3 -1  3 -3 -3 -1 -4
+L -1 -2 -3 -4 -1 -2 -3 -4 -3  2  4 -2  2  0 -3 -2 -1 -2 -1  1 -4 -3 -1 -4
+K -1  2  0 -1 -3  1  1 -2 -1 -3 -2  5 -1 -3 -1  0 -1 -3 -2 -2  0  1 -1 -4
+M -1 -1 -2 -3 -1  0 -2 -3 -2  1  2 -1  5  0 -2 -1 -1 -1 -1  1 -3 -1 -1 -4
+F -2 -3 -3 -3 -2 -3 -3 -3 -1  0  0 -3  0  6 -4 -2 -2  1  3 -1 -3 -3 -1 -4
+P -1 -2 -2 -1 -3 -1 -1 -2 -2 -3 -3 -1 -2 -4  7 -1 -1 -4 -3 -2 -2 -1 -2 -4
+S  1 -1  1  0 -1  0  0  0 -1 -2 -2  0 -1 -2 -1  4  1 -3 -2 -2  0  0  0 -4
+T  0 -1  0 -1 -1 -1 -1 -2 -2 -1 -1 -1 -1 -2 -1  1  5 -2 -2  0 -1 -1  0 -4
+W -3 -3 -4 -4 -2 -2 -3 -2 -2 -3 -2 -3 -1  1 -4 -3 -2 11  2 -3 -4 -3 -2 -4
+Y -2 -2 -2 -3 -2 -1 -2 -3  2 -1 -1 -2 -1  3 -3 -2 -2  2  7 -1 -3 -2 -1 -4
+V  0 -3 -3 -3 -1 -2 -2 -3 -3  3  1 -2  1 -1 -2 -2  0 -3 -1  4 -3 -2 -1 -4
+B -2 -1  3  4 -3  0  1 -1  0 -3 -4  0 -3 -3 -2  0 -1 -4 -3 -3  4  1 -1 -4
+Z -1  0  0  1 -3  3  4 -2  0 -3 -3  1 -1 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+X  0 -1 -1 -1 -2 -1 -1 -1 -1 -1 -1 -1 -1 -1 -2  0  0 -2 -1 -1 -1 -1 -1 -4
+* -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4  1
+"""
+MATRICES = {"BLOSUM62": BLOSUM62}
+
+
+def parse_matrix(text):
+    """parses a substitution matrix in NCBI format: # comments, a header line with the alphabet,
+    one line per char with its scores
+    :returns: tuple (alphabet, matrix)"""
+    alphabet = None
+    rows = []
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        if alphabet is None:
+            alphabet = "".join(fields)
+            continue
+        if fields[0] != alphabet[len(rows)] or len(fields) != len(alphabet) + 1:
+            raise ValueError("Invalid row {} of substitution matrix.".format(line.strip()))
+        rows.append([float(v) for v in fields[1:]])
+    if alphabet is None or len(rows) != len(alphabet):
+        raise ValueError("Substitution matrix must have one row per char of the alphabet.")
+    return alphabet, np.array(rows)
+
+
+def read_matrix(path):
+    """reads a substitution matrix file in NCBI format (e.g. BLOSUM, PAM from ftp.ncbi.nih.gov/blast/matrices)
+    :returns: tuple (alphabet, matrix)"""
+    with open(path) as f:
+        return parse_matrix(f.read())
+
+
+class Scoring:
+    """
+    Substitution scores of an alphabet and affine gap costs, a gap of length k costs gap_open + k * gap_extend.
+    Sequences are encoded as indices into the alphabet, lower case chars are scored as upper case,
+    '_' (stop in translate) as '*', unknown chars as 'X' resp. '*' if the alphabet has them.
+    The query profile (alphabet x query length) turns the substitution scores of one DP row into one gather.
+    """
+    def __init__(self, alphabet, matrix, gap_open=10, gap_extend=1):
+        self.alphabet = alphabet
+        self.matrix = np.asarray(matrix, dtype=np.float64)
+        self.gap_open = gap_open
+        self.gap_extend = gap_extend
+        self.index = np.full(256, -1, dtype=np.intp) # char -> index into the alphabet
+        for c in ("*", "X"):
+            if c in alphabet:
+                self.index[:] = alphabet.index(c)
+        if "*" in alphabet:
+            self.index[ord("_")] = alphabet.index("*")
+        for i, c in enumerate(alphabet):
+            self.index[ord(c.lower())] = i
+        for i, c in enumerate(alphabet): # exact chars win over lower case
+            self.index[ord(c)] = i
+
+    @classmethod
+    def simple(cls, match=1, mismatch=-1, gap_open=0, gap_extend=1):
+        """match / mismatch scoring of all chars (case sensitive like nw.is_match), gap_open=0 is a linear gap"""
+        alphabet = bytes(range(256)).decode("latin-1")
+        matrix = np.where(np.eye(256, dtype=bool), float(match), float(mismatch))
+        return cls(alphabet, matrix, gap_open, gap_extend)
+
+    @classmethod
+    def from_name(cls, name, gap_open=10, gap_extend=1):
+        """scoring with a built in matrix (see MATRICES) or a matrix file"""
+        if name.upper() in MATRICES:
+            return cls(*parse_matrix(MATRICES[name.upper()]), gap_open, gap_extend)
+        return cls(*read_matrix(name), gap_open, gap_extend)
+
+    def encode(self, seq):
+        """
+        :param seq: str
+        :return: array of alphabet indices
+        """
+        codes = self.index[np.frombuffer(str(seq).encode("latin-1"), dtype=np.uint8)]
+        if len(codes) and codes.min() < 0:
+            bad = str(seq)[int(np.argmax(codes < 0))]
+            raise ValueError("Char {!r} is not in the alphabet of the substitution matrix.".format(bad))
+        return codes
+
+    def profile(self, query, chars=None):
+        """
+        Query profile: scores of every char of the alphabet against every position of query.
+        :param query: str
+        :param chars: optional alphabet indices, only these rows are computed
+        :return: float array (alphabet or len(chars)) x len(query)
+        """
+        rows = self.matrix if chars is None else self.matrix[chars]
+        return rows[:, self.encode(query)]
+
+    def row_profile(self, x, y):
+        """
+        Profile of y for the distinct chars of x.
+        :return: tuple (profile, rows), rows[i] is the profile row of x[i]
+        """
+        chars, rows = np.unique(self.encode(x), return_inverse=True)
+        return self.profile(y, chars), rows
+
+    def gap(self, length):
+        """cost of a gap of the given length"""
+        return self.gap_open + length * self.gap_extend if length else 0
+
+    def score_alignment(self, seqX, seqY):
+        """score of an alignment given as two strings of the same length with '-' as gap"""
+        score = 0.0
+        gap_x = gap_y = 0 # length of the current gap in seqX resp. seqY
+        for a, b in zip(seqX, seqY):
+            if a == "-":
+                gap_x += 1
+                score -= self.gap(gap_y)
+                gap_y = 0
+            elif b == "-":
+                gap_y += 1
+                score -= self.gap(gap_x)
+                gap_x = 0
+            else:
+                score -= self.gap(gap_x) + self.gap(gap_y)
+                gap_x = gap_y = 0
+                score += self.matrix[self.index[ord(a)], self.index[ord(b)]]
+        return score - self.gap(gap_x) - self.gap(gap_y)
@@ -0,0 +1,188 @@
+""" Local alignment with affine gaps (Smith-Waterman-Gotoh) of a short query inside a long target
+    :functions: sw_score(query, target, scoring), sw_align(query, target, scoring)
+
+    Same recurrences as gotoh.py with H(i,j) = max(0, ...), the score is the maximum of H.
+    The score is computed with Farrar's striped query profile: the query is cut into `lanes` stripes of
+    segs = ceil(len(query) / lanes) positions, vector s holds the positions s, segs + s, 2 * segs + s, ...
+    A column (one target char) then needs segs vector operations, E comes from the previous column,
+    F is first only carried within a stripe and then corrected across the stripes by the lazy F loop,
+    which stops as soon as F cannot change H anymore.
+    The vectors are int16 numpy arrays, the target is cut into overlapping chunks that are aligned in lockstep
+    (one vector per chunk), if a score gets too close to the int16 range the pass is repeated with int32.
+    The traceback is only computed for the window of the best local alignment."""
+import numpy as np
+import scoring as sc
+import gotoh
+
+LANES = 16 # stripes of the query profile, 16 int16 = one 256 bit register
+CHUNK = 1024 # target chars per chunk without the overlap
+
+
+def striped_profile(scoring, query, chars, lanes=LANES, dtype=np.int16):
+    """
+    Striped query profile: entry [c, s, l] is the score of chars[c] against query[l * segs + s],
+    positions behind the end of the query score 0.
+    :return: array len(chars) x segs x lanes
+    """
+    m = len(query)
+    segs = max(1, -(-m // lanes))
+    profile = np.zeros((len(chars), segs * lanes), dtype=dtype)
+    profile[:, :m] = scoring.profile(query, chars)
+    return profile.reshape(len(chars), lanes, segs).transpose(0, 2, 1).copy()
+
+
+def _shift(v, fill):
+    """moves every lane one stripe further (lane l -> l + 1), lane 0 gets fill"""
+    out = np.empty_like(v)
+    out[..., 0] = fill
+    out[..., 1:] = v[..., :-1]
+    return out
+
+
+def _striped_pass(profile, rows, lengths, o, e, limit):
+    """
+    Striped Smith-Waterman of the query against all chunks in lockstep.
+    :param profile: striped profile of the chars of the target
+    :param rows: chunks x columns, profile index of every target char of the chunks
+    :param lengths: number of real chars per chunk, the rest is padding
+    :param limit: the pass is aborted if a score reaches this value
+    :return: tuple (best, column, query position) per chunk or None if the limit was reached
+    """
+    _, segs, lanes = profile.shape
+    count, columns = rows.shape
+    dtype = profile.dtype
+    low = -(o + e) # E and F never drop below this since H >= 0
+    h_store = np.zeros((segs, count, lanes), dtype=dtype)
+    h_load = np.zeros_like(h_store)
+    gap_e = np.full_like(h_store, low)
+    best = np.zeros(count, dtype=dtype)
+    best_col = np.zeros(count, dtype=np.intp)
+    best_pos = np.zeros(count, dtype=np.intp)
+    for j in range(columns):
+        prof = profile[rows[:, j]] # chunks x segs x lanes
+        gap_f = np.full((count, lanes), low, dtype=dtype)
+        h = _shift(h_store[segs-1], 0)
+        h_load, h_store = h_store, h_load
+        for s in range(segs):
+            h = h + prof[:, s]
+            np.maximum(h, gap_e[s], out=h)
+            np.maximum(h, gap_f, out=h)
+            np.maximum(h, 0, out=h)
+            h_store[s] = h
+            h -= o + e
+            np.maximum(gap_e[s] - e, h, out=gap_e[s])
+            np.maximum(gap_f - e, h, out=gap_f)
+            h = h_load[s]
+        # lazy F: carry F into the next stripe while it still beats opening a gap from H
+        gap_f = _shift(gap_f, low)
+        s = 0
+        while np.any(gap_f > h_store[s] - o):
+            np.maximum(h_store[s], gap_f, out=h_store[s])
+            np.maximum(gap_e[s], h_store[s] - (o + e), out=gap_e[s])
+            gap_f -= e
+            s += 1
+            if s == segs:
+                gap_f = _shift(gap_f, low)
+                s = 0
+        col = h_store.max(axis=(0, 2))
+        col[j >= lengths] = 0
+        better = np.flatnonzero(col > best)
+        if len(better):
+            best[better] = col[better]
+            best_col[better] = j
+            # flat index s * lanes + l of the first maximum -> query position l * segs + s
+            flat = h_store[:, better].transpose(1, 0, 2).reshape(len(better), -1).argmax(axis=1)
+            best_pos[better] = (flat % lanes) * segs + flat // lanes
+            if col.max() >= limit:
+                return None
+    return best, best_col, best_pos
+
+
+def _score_dtypes(scoring, profile):
+    """int16 and int32 for integer scores, float64 otherwise"""
+    values = np.concatenate((profile.ravel(), [scoring.gap_open, scoring.gap_extend]))
+    return (np.int16, np.int32) if np.all(values == np.round(values)) else (np.float64,)
+
+
+def sw_score(query, target, scoring=None, lanes=LANES, chunk=CHUNK):
+    """Best local alignment score of query (short) in target (long) with the striped profile.
+    The target is cut into chunks of `chunk` chars that are extended to the left by the longest possible
+    local alignment, m + m * max score / gap_extend chars, so every alignment lies completely in the chunk
+    of its end. Without gap_extend the target is one chunk.
+    :param scoring: scoring.Scoring, default match 1, mismatch -1, linear gap 1
+    :param lanes: number of stripes of the query profile
+    :returns: tuple (score, query end, target end), ends are exclusive, (0, 0, 0) if no score is positive"""
+    scoring = scoring or sc.Scoring.simple()
+    query, target = str(query), str(target)
+    m, n = len(query), len(target)
+    if m == 0 or n == 0:
+        return 0, 0, 0
+    o, e = scoring.gap_open, scoring.gap_extend
+    chars, codes = np.unique(scoring.encode(target), return_inverse=True)
+    top = max(float(scoring.profile(query, chars).max()), 0)
+    if e > 0:
+        overlap = m + int(np.ceil(m * top / e))
+        chunk = max(chunk, 1)
+    else:
+        overlap, chunk = 0, n
+    starts = np.maximum(np.arange(0, n, chunk) - overlap, 0)
+    ends = np.minimum(np.arange(0, n, chunk) + chunk, n)
+    columns = int((ends - starts).max())
+    # chunks x columns matrix of profile indices, padded at the end
+    rows = np.zeros((len(starts), columns), dtype=np.intp)
+    for r, (a, b) in enumerate(zip(starts, ends)):
+        rows[r, :b-a] = codes[a:b]
+    for dtype in _score_dtypes(scoring, scoring.profile(query, chars)):
+        profile = striped_profile(scoring, query, chars, lanes, dtype)
+        limit = np.iinfo(dtype).max - top if np.issubdtype(dtype, np.integer) else np.inf
+        result = _striped_pass(profile, rows, ends - starts, dtype(o), dtype(e), limit)
+        if result is not None:
+            break
+    best, best_col, best_pos = result
+    k = int(np.argmax(best))
+    if best[k] <= 0:
+        return 0, 0, 0
+    score = best[k].item()
+    return score, int(best_pos[k]) + 1, int(starts[k] + best_col[k]) + 1
+
+
+def _local_start(query, target, score, scoring):
+    """start of a local alignment with the given score ending at the ends of query and target:
+    the reversed sequences are aligned with the start fixed at (0, 0) and a free end,
+    the first row reaching the score gives the start
+    :returns: tuple (query start, target start)"""
+    o, e = scoring.gap_open, scoring.gap_extend
+    x, y = query[::-1], target[::-1]
+    m = len(y)
+    profile, rows = scoring.row_profile(x, y)
+    h = -(o + np.arange(m+1) * e)
+    h[0] = 0
+    f = np.full(m+1, -np.inf)
+    sub = np.zeros(m+1)
+    for i in range(1, len(x)+1):
+        diag = np.concatenate(([-np.inf], h[:-1]))
+        sub[1:] = profile[rows[i-1]]
+        h, f, _ = gotoh._affine_row(diag, h, f, sub, o, e)
+        hit = np.flatnonzero(h >= score)
+        if len(hit):
+            return len(x) - i, m - int(hit[0])
+    raise ValueError("No local alignment with score {} ends here.".format(score))
+
+
+def sw_align(query, target, scoring=None, lanes=LANES, chunk=CHUNK):
+    """Best local alignment of query in target: score and ends come from sw_score, the start from an anchored
+    alignment of the reversed window, the alignment itself from gotoh on the window only
+    :returns: tuple (seqQ, seqT, score, (query start, query end), (target start, target end)),
+    0-based, end exclusive, empty alignment if no score is positive"""
+    scoring = scoring or sc.Scoring.simple()
+    query, target = str(query), str(target)
+    score, q1, t1 = sw_score(query, target, scoring, lanes, chunk)
+    if score <= 0:
+        return "", "", 0, (0, 0), (0, 0)
+    span = q1 + int(np.ceil(q1 * max(float(scoring.matrix.max()), 0) / scoring.gap_extend)) \
+        if scoring.gap_extend > 0 else t1
+    window = max(0, t1 - span)
+    q0, t0 = _local_start(query[:q1], target[window:t1], score, scoring)
+    t0 += window
+    seqQ, seqT, _ = gotoh.gotoh(query[q0:q1], target[t0:t1], scoring)
+    return seqQ, seqT, score, (q0, q1), (t0, t1)
@@ -1,111 +1,137 @@
 import argparse
+import gzip
+import time
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import numpy as np
+from scipy import sparse
+from scipy.optimize import milp, LinearConstraint, Bounds
+import fasta
 
 """ Task 02 Simple mixed cycles """
 s1 = "CGTA"
 s2 = "CGAT"
 s3 = "GATAT"
-seqs = [s1, s2, s3]
-len_seqs = len(seqs)
+EXAMPLE_SEQS = [s1, s2, s3]
 
 
-def calc_2constraints(seqs):
+BUFFER_SIZE = 1 << 20 # bytes of the buffered writer of the .lp and .mps file
+GZIP_LEVEL = 6 # compression level of .mps.gz files, 9 is much slower for little gain
+LINES_PER_WRITE = 1 << 16 # lines of the .mps file joined to one write
+EDGE = "X{}_{}__{}_{}" # .lp name of the edge between char i of seq lidx and char j of seq l2idx, e.g. X0_10__1_2
+
+
+def seq_pairs(seqs):
+    """
+    all pairs of sequences, compares seq 0 - 1, 0 - 2, 1 - 2
+    :param seqs: list of sequences
+    :return: generator of tuples (lidx, l2idx)
+    """
+    for lidx in range(len(seqs)):
+        for l2idx in range(lidx + 1, len(seqs)):
+            yield lidx, l2idx
+
+
+def seq_triples(seqs):
+    """
+    all triples of sequences, compares seq 0 - 1 - 2, 0 - 1 - 3, ...
+    :param seqs: list of sequences
+    :return: generator of tuples (lidx, l2idx, l3idx)
+    """
+    for lidx, l2idx in seq_pairs(seqs):
+        for l3idx in range(l2idx + 1, len(seqs)):
+            yield lidx, l2idx, l3idx
+
+
+def edge_mask(seqs, candidates, lidx, l2idx):
+    """
+    candidate edges between two sequences
+    :param candidates: dict (lidx, l2idx) -> boolean array len(seqs[lidx]) x len(seqs[l2idx]), None = all edges
+    :return: boolean array
+    """
+    if candidates is None:
+        return np.ones((len(seqs[lidx]), len(seqs[l2idx])), dtype=bool)
+    return candidates[lidx, l2idx]
+
+
+def rows_of(mask):
+    """
+    candidate columns of every row of a mask as sorted lists
+    """
+    return [np.flatnonzero(row).tolist() for row in mask]
+
+
+def calc_2constraints(seqs, candidates=None):
     """
     for each seq in seqs this function sets up crossovers between each two seq
-    it appends the inequality to a list
-    it calculates the number of inequalities
+    it yields the inequalities one by one
     example:
     00 01
     10 11
-    -> x00_11 + x01_10 < 1
+    -> X0_0__1_1 + X0_1__1_0 < 1
     lidx  a  lidx  c
     l2idx d  l2idx b
-    -> xlidx a_l2idx b + xlidx c_l2idx d < 1
+    -> Xlidx_a__l2idx_b + Xlidx_c__l2idx_d < 1
     :param seqs: list of sequences to compare
-    :return: (inequalities, number of inequalities
+    :param candidates: candidate edges (see edge_mask), only constraints between them are generated
+    :return: generator of inequalities
     """
-    count = 0
-    cycles = []
-    # number of seqs
-    nr_seqs = len(seqs)
-    for lidx in range(nr_seqs):
-        for l2idx in range(1, nr_seqs):
-            if lidx < l2idx: # compare seq 0 - 1, 0 - 2, 1 - 2
-                #print(lidx, l2idx)
-                n = len(seqs[lidx])
-                m = len(seqs[l2idx])
-
-                # cross overs between two seq
-                for a in range(n):  # upper left
-                    for b in range(m):  # lower right
-                        for c in range(a, n):  # upper right
-                            for d in range(m):  # lower left
-                                if (a != c or b != d) and d <= b:
-                                    cycles.append("X{}{}_{}{} + X{}{}_{}{} < 1;"
-                                                  .format(lidx, a, l2idx, b, lidx, c, l2idx, d))
-                                    count += 1
-
-    cycles = sorted(cycles)
-    return (cycles, count)
-
-
-def calc_3constraints(seqs):
-    """
-    calculates all constraints between three sequences given a list of three sequences and returns them as inequalities
-    :param seqs: list of sequences to compare
-    :return: (inequalities, number of inequalities)
-    """
-    count = 0
-    cycles = []
-    # number of seqs
-    nr_seqs = len(seqs)
+    for lidx, l2idx in seq_pairs(seqs):
+        cols = rows_of(edge_mask(seqs, candidates, lidx, l2idx))
+        n = len(seqs[lidx])
 
-    n = len(seqs[0])
-    m = len(seqs[1])
-    o = len(seqs[2])
+        # cross overs between two seq
+        for a in range(n):  # upper left
+            for b in cols[a]:  # lower right
+                for c in range(a, n):  # upper right
+                    for d in cols[c]:  # lower left, d <= b
+                        if d > b or (c == a and d == b):
+                            break
+                        yield "{} + {} < 1;".format(EDGE.format(lidx, a, l2idx, b), EDGE.format(lidx, c, l2idx, d))
 
-    for a in range(n):
-        for b in range(m):
-            for c in range(o):
-                for d in range(c-1):
-                    for e in range(a+1, n):
-                        cycles.append("X{}{}_{}{} + X{}{}_{}{} + X{}{}_{}{} < 2;"
-                                      .format(0, a, 1, b, 1, b, 2, c, 2, d, 0, e))
-                        count += 1
 
-                for d in range(c+1, o):
-                    for e in range(a-1):
-                        cycles.append("X{}{}_{}{} + X{}{}_{}{} + X{}{}_{}{} < 2;"
-                                      .format(0, a, 1, b, 1, b, 2, c, 2, d, 0, e))
-                        count += 1
+def calc_3constraints(seqs, candidates=None):
+    """
+    calculates the constraints of the mixed cycles through three sequences for every triple of the N sequences
+    and yields them as inequalities,
+    the third edge is the edge between pe and rd (see triple_cycles)
+    :param seqs: list of sequences to compare
+    :param candidates: candidate edges (see edge_mask), only constraints between them are generated
+    :return: generator of inequalities
+    """
+    for p, q, r in seq_triples(seqs):
+        cols01 = rows_of(edge_mask(seqs, candidates, p, q))
+        cols12 = rows_of(edge_mask(seqs, candidates, q, r))
+        rows02 = rows_of(edge_mask(seqs, candidates, p, r).T)  # candidate e of every d
 
-    cycles = sorted(cycles)
-    return (cycles, count)
+        for a in range(len(seqs[p])):
+            for b in cols01[a]:
+                first = EDGE.format(p, a, q, b) + " + " + EDGE.format(q, b, r, "") # shared by all (c, d, e)
+                for c in cols12[b]:
+                    for d in range(c-1):
+                        for e in rows02[d][bisect_right(rows02[d], a):]:
+                            yield "{}{} + {} < 2;".format(first, c, EDGE.format(p, e, r, d))
 
+                    for d in range(c+1, len(rows02)):
+                        for e in rows02[d][:bisect_left(rows02[d], a-1)]:
+                            yield "{}{} + {} < 2;".format(first, c, EDGE.format(p, e, r, d))
 
-def calc_binary_constraints(seqs):
+
+def calc_binary_constraints(seqs, candidates=None):
     """
-    Calculates each edge between each char in each sequence and returns it as constraint
+    Calculates each edge between each char in each sequence and yields it as constraint
     e.g.
-    X00_10<1;
-    X00_11<1;
-    X00_12<1;
+    X0_0__1_0<1;
+    X0_0__1_1<1;
+    X0_0__1_2<1;
     :param seqs: list of sequences
-    :return: (bin_cons, count_of_bincons)
+    :param candidates: candidate edges (see edge_mask)
+    :return: generator of constraints
     """
-    bin_cons = []
-    count = 0
-    nr_seqs = len(seqs)
-    for lidx in range(nr_seqs):
-        for l2idx in range(1, nr_seqs):
-            if lidx < l2idx:
-                n, m = len(seqs[lidx]), len(seqs[l2idx])
-                for i in range(n):
-                    for j in range(m):
-                        #print("X{}{}_{}{}<1;".format(lidx, i, l2idx, j))
-                        bin_cons.append("X{}{}_{}{}<1;".format(lidx, i, l2idx, j))
-                        count += 1
-    bin_cons = sorted(bin_cons)
-    return (bin_cons, count)
+    for es in all_edges(seqs, candidates):
+        yield es + "<1;"
 
 
 def is_match(chr1, chr2):
@@ -121,124 +147,844 @@ def is_match(chr1, chr2):
         return False
 
 
-def setup_objective_function(seqs):
+def setup_objective_function(seqs, candidates=None):
     """
-    sets up the objective function in the form:
-    max 1*X11_21+4*X12_21+ ... ;
+    sets up the terms of the objective function in the form:
+    max 1*X1_1__2_1+4*X1_2__2_1+ ... ;
     with match = 4, and mismatch = 1
     :param seqs: list of sequences
-    :return: objective function
-    """
-    obj_entr = []
-    obj_fct = "max: "
-    nr_seqs = len(seqs)
-    for lidx in range(nr_seqs):
-        for l2idx in range(1, nr_seqs):
-            if lidx < l2idx:
-                n, m = len(seqs[lidx]), len(seqs[l2idx])
-                for i in range(n):
-                    for j in range(m):
-                        if is_match(seqs[lidx][i], seqs[l2idx][j]):
-                            obj_entr.append("4*X{}{}_{}{}".format(lidx, i, l2idx, j))
-                        else:
-                            obj_entr.append("1*X{}{}_{}{}".format(lidx, i, l2idx, j))
-    obj_entr = sorted(obj_entr)
-    for i in obj_entr:
-        obj_fct += i  + "+"
-    obj_fct = obj_fct[:-1] + ";"
-    return obj_fct
-
-
-def all_edges(seqs):
+    :param candidates: candidate edges (see edge_mask)
+    :return: generator of terms, e.g. 4*X1_2__2_1
+    """
+    for lidx, l2idx in seq_pairs(seqs):
+        for i, cols in enumerate(rows_of(edge_mask(seqs, candidates, lidx, l2idx))):
+            for j in cols:
+                if is_match(seqs[lidx][i], seqs[l2idx][j]):
+                    yield "4*" + EDGE.format(lidx, i, l2idx, j)
+                else:
+                    yield "1*" + EDGE.format(lidx, i, l2idx, j)
+
+
+def all_edges(seqs, candidates=None):
     """
     Calculates each edge between each char in each sequence
     :param seqs: list of sequences
-    :return: (bin_cons, count_of_bincons)
+    :param candidates: candidate edges (see edge_mask)
+    :return: generator of edges, e.g. X0_0__1_0
+    """
+    for lidx, l2idx in seq_pairs(seqs):
+        for i, cols in enumerate(rows_of(edge_mask(seqs, candidates, lidx, l2idx))):
+            for j in cols:
+                yield EDGE.format(lidx, i, l2idx, j)
+
+
+def joined(items, sep):
+    """
+    joins a stream of strings like str.join without building the string
+    :return: generator of strings
+    """
+    for k, item in enumerate(items):
+        yield sep + item if k else item
+
+
+def write_lines(f, lines):
+    """
+    writes one line per item
+    :return: number of lines
     """
-    es = []
     count = 0
-    nr_seqs = len(seqs)
-    for lidx in range(nr_seqs):
-        for l2idx in range(1, nr_seqs):
-            if lidx < l2idx:
-                n, m = len(seqs[lidx]), len(seqs[l2idx])
-                for i in range(n):
-                    for j in range(m):
-                        #print("X{}{}_{}{}<1;".format(lidx, i, l2idx, j))
-                        es.append("X{}{}_{}{}".format(lidx, i, l2idx, j))
-                        count += 1
-    es = sorted(es)
-    return (es, count)
-
-
-def edges_as_int(es):
-    es_as_int = "".join("int ")
-    for i in es:
-        es_as_int += i + ", "
-    es_as_int = es_as_int[:-2] + ";"
-    return es_as_int
-
-
-# writes a fasta file
-def write(obj_fct, cycles, bin_cons, es_as_int, file_path = None):
-    """
-    writes it parameters to an .lp file for solving the inequalities with lp_solve "http://lpsolve.sourceforge.net/"
-    :param obj_fct: objective function: e.g. max 1*X11_21+4*X12_21+ ... ;
-    :param cycles: simple mixed cycles constraints: e.g. x00_11 + x01_10 < 1;
-                                                         ...
-    :param bin_cons: binary constraints: e.g.   X00_10<1;
-                                                X00_11<1;
-                                                X00_12<1;
-    :param es_as_int: all edges have to be defined as integers in the last row: e.g. int X00_10, X00_11, X00_12, ...;
-    :param file_path: file path, has to end with .lp
-    :return:
+    for line in lines:
+        f.write(line)
+        f.write("\n")
+        count += 1
+    return count
+
+
+def write(seqs, file_path=None, candidates=None):
+    """
+    streams the lp for the sequences to an .lp file for solving the inequalities with lp_solve
+    "http://lpsolve.sourceforge.net/", every part is written while it is generated:
+    objective function: e.g. max 1*X1_1__2_1+4*X1_2__2_1+ ... ;
+    simple mixed cycles constraints: e.g. X0_0__1_1 + X0_1__1_0 < 1;
+                                          ...
+    binary constraints: e.g.   X0_0__1_0<1;
+                               X0_0__1_1<1;
+                               X0_0__1_2<1;
+    all edges have to be defined as integers in the last row: e.g. int X0_0__1_0, X0_0__1_1, X0_0__1_2, ...;
+    :param seqs: list of N sequences, constraints are generated for every pair and triple of them
+    :param file_path: file path, has to end with .lp (.mps and .mps.gz files are written by write_mps)
+    :param candidates: candidate edges (see edge_mask), only these edges are variables
+    :return: (number of 2s constraints, number of 3s constraints), None if the path is wrong
     """
     if (file_path != None) and file_path[-3:] == ".lp":
-        with open(file_path, "w") as f:
-            f.write("".join(obj_fct+ "\n\n"))
-            f.write("".join("%s\n" % c for c in cycles))
-            f.write("\n\n")
-            f.write("".join("%s\n" % bc for bc in bin_cons))
+        with open(file_path, "w", buffering=BUFFER_SIZE) as f:
+            f.write("max: ")
+            f.writelines(joined(setup_objective_function(seqs, candidates), "+"))
+            f.write(";\n\n")
+            count2 = write_lines(f, calc_2constraints(seqs, candidates))
+            count3 = write_lines(f, calc_3constraints(seqs, candidates))
             f.write("\n\n")
-            f.write("".join(es_as_int))
-            print(file_path + "\n successfully written.")
+            write_lines(f, calc_binary_constraints(seqs, candidates))
+            f.write("\n\nint ")
+            f.writelines(joined(all_edges(seqs, candidates), ", "))
+            f.write(";")
+        print(file_path + "\n successfully written.")
+        return count2, count3
     else:
-        print("EITHER NO FILEPATH SPECIFIED OR WRONG ENDING. FILE HAS TO END WITH '.lp'")
+        print("EITHER NO FILEPATH SPECIFIED OR WRONG ENDING. FILE HAS TO END WITH '.lp', '.mps' OR '.mps.gz'")
 
 
+""" candidate edges: pairs of chars that are clearly unalignable get no variable """
+def band_candidates(n, m, width):
+    """
+    edges within width of the diagonal from (0, 0) to (n-1, m-1)
+    :return: boolean array n x m
+    """
+    i = np.arange(n)[:, None] * ((m - 1) / max(n - 1, 1))
+    return np.abs(np.arange(m)[None, :] - i) <= width
 
-""" MAIN """
-# creating parser for out file specification -> in.lp
-parser = argparse.ArgumentParser(description="Creates an .lp file for three sequences."
-                                             "With lp_solve /file/path/to/in.lp"
-                                             "from directory of lp_solve")
-parser.add_argument("Path",
-                    metavar="path",
-                    type=str,
-                    help="Output path of lp file.")
 
+def kmer_candidates(s, t, k):
+    """
+    edges supported by shared k-mers: the chars of every shared k-mer pair and all edges within k of them
+    (in both sequences)
+    :return: boolean array len(s) x len(t)
+    """
+    n, m = len(s), len(t)
+    seeds = np.zeros((n + 1, m + 1), dtype=np.int64)
+    if n >= k and m >= k:
+        kmers = {}
+        for j in range(m - k + 1):
+            kmers.setdefault(t[j:j + k], []).append(j)
+        hit = np.zeros((n, m), dtype=bool)
+        for i in range(n - k + 1):
+            for j in kmers.get(s[i:i + k], ()):
+                hit[i + np.arange(k), j + np.arange(k)] = True
+        # number of seed cells in the square of radius k around every edge via a summed area table
+        seeds[1:, 1:] = np.cumsum(np.cumsum(hit, axis=0), axis=1)
+    lo_i, hi_i = np.clip(np.arange(n) - k, 0, n), np.clip(np.arange(n) + k + 1, 0, n)
+    lo_j, hi_j = np.clip(np.arange(m) - k, 0, m), np.clip(np.arange(m) + k + 1, 0, m)
+    count = (seeds[hi_i][:, hi_j] - seeds[lo_i][:, hi_j] - seeds[hi_i][:, lo_j] + seeds[lo_i][:, lo_j])
+    return count > 0
+
+
+def nw_path(s, t):
+    """
+    optimal pairwise alignment with the weights of the objective function (match 4, mismatch 1, gap 0),
+    Needleman-Wunsch with one row per step: F(i, j) = max(F(i-1, j-1) + w, F(i-1, j), F(i, j-1)),
+    the left neighbour is a cumulative maximum
+    :return: list of points (i, j) of the path from (n, m) to (0, 0)
+    """
+    n, m = len(s), len(t)
+    weight = np.where(np.frombuffer(s.encode(), dtype=np.uint8)[:, None]
+                      == np.frombuffer(t.encode(), dtype=np.uint8)[None, :], 4, 1)
+    f = np.zeros((n + 1, m + 1), dtype=np.int64)
+    for i in range(1, n + 1):
+        f[i, 1:] = np.maximum(f[i - 1, :-1] + weight[i - 1], f[i - 1, 1:])
+        f[i] = np.maximum.accumulate(f[i])
+    i, j = n, m
+    path = [(i, j)]
+    while i > 0 and j > 0:
+        if f[i, j] == f[i - 1, j - 1] + weight[i - 1, j - 1]:
+            i, j = i - 1, j - 1
+        elif f[i, j] == f[i - 1, j]:
+            i -= 1
+        else:
+            j -= 1
+        path.append((i, j))
+    return path + [(a, 0) for a in range(i - 1, -1, -1)] + [(0, b) for b in range(j - 1, -1, -1)]
+
+
+def nw_candidates(s, t, width):
+    """
+    edges within width of the optimal pairwise alignment (nw_path) in every row
+    :return: boolean array len(s) x len(t)
+    """
+    n, m = len(s), len(t)
+    lo, hi = np.full(n, m), np.full(n, -1)
+    for i, j in nw_path(s, t):  # point (i, j) lies between the chars i-1 and i of s and j-1 and j of t
+        for row in (i - 1, i):
+            if 0 <= row < n:
+                lo[row], hi[row] = min(lo[row], j - 1), max(hi[row], j)
+    cols = np.arange(m)[None, :]
+    return (cols >= lo[:, None] - width) & (cols <= hi[:, None] + width)
 
-args = parser.parse_args()
-inPath = args.Path
 
-# set up the objective function
-obj_fct = setup_objective_function(seqs)
+def candidate_edges(seqs, band=None, kmer=None, nw=None):
+    """
+    candidate edges of every pair of sequences, an edge has to pass every given filter
+    :param band: width of the diagonal band (band_candidates)
+    :param kmer: k of the shared k-mers (kmer_candidates)
+    :param nw: width around the optimal pairwise alignment (nw_candidates)
+    :return: dict (lidx, l2idx) -> boolean array, None if no filter is given
+    """
+    if band is None and kmer is None and nw is None:
+        return None
+    candidates = {}
+    for lidx, l2idx in seq_pairs(seqs):
+        s, t = seqs[lidx], seqs[l2idx]
+        mask = np.ones((len(s), len(t)), dtype=bool)
+        if band is not None:
+            mask &= band_candidates(len(s), len(t), band)
+        if kmer is not None:
+            mask &= kmer_candidates(s, t, kmer)
+        if nw is not None:
+            mask &= nw_candidates(s, t, nw)
+        candidates[lidx, l2idx] = mask
+    return candidates
+
+
+""" in-process model: integer variable IDs, sparse constraint matrix, MIP solved with HiGHS """
+def edge_ids(seqs, candidates=None):
+    """
+    variable IDs of the candidate edges in the order of all_edges
+    :param seqs: list of sequences
+    :param candidates: candidate edges (see edge_mask)
+    :return: (dict (lidx, l2idx) -> int array len(seqs[lidx]) x len(seqs[l2idx]) of IDs, -1 if pruned,
+    number of edges)
+    """
+    ids = {}
+    count = 0
+    for lidx, l2idx in seq_pairs(seqs):
+        mask = edge_mask(seqs, candidates, lidx, l2idx)
+        grid = np.full(mask.shape, -1, dtype=np.int64)
+        grid[mask] = np.arange(count, count + mask.sum())
+        ids[lidx, l2idx] = grid
+        count += int(mask.sum())
+    return ids, count
 
-# set up inequalities for all simple mixed cycles
-cycles2, no_of_cycles2 = calc_2constraints(seqs)
-cycles3, no_of_cycles3 = calc_3constraints(seqs)
 
-cycles = cycles2 + cycles3
-no_of_cycles = no_of_cycles2 + no_of_cycles3
+def objective_weights(seqs, ids):
+    """
+    objective function as vector over the edge IDs, match = 4, mismatch = 1
+    :param seqs: list of sequences
+    :return: float array
+    """
+    weights = [np.zeros(0)]
+    for lidx, l2idx in seq_pairs(seqs):
+        s = np.frombuffer(seqs[lidx].encode(), dtype=np.uint8)
+        t = np.frombuffer(seqs[l2idx].encode(), dtype=np.uint8)
+        weights.append(np.where(s[:, None] == t[None, :], 4.0, 1.0)[ids[lidx, l2idx] >= 0])
+    return np.concatenate(weights)
+
 
-# set up binary constraints
-bin_cons, bin_cons_count = calc_binary_constraints(seqs)
+def pair_cycles(grid):
+    """
+    the 2s constraints of calc_2constraints between two sequences as edge IDs:
+    every candidate (a, b) is paired with the candidates (c, d), c >= a, d <= b (d < b for c == a),
+    these are sorted by d (+ 0.5 for c == a) so the partners of b are a prefix
+    :param grid: edge IDs of the pair (see edge_ids)
+    :return: array k x 2
+    """
+    blocks = [np.zeros((0, 2), dtype=np.int64)]
+    for a in range(grid.shape[0]):
+        firsts = grid[a][grid[a] >= 0]
+        if len(firsts) == 0:
+            continue
+        c, d = np.nonzero(grid[a:] >= 0)
+        order = np.argsort(d + np.where(c == 0, 0.5, 0), kind="stable")
+        keys = (d + np.where(c == 0, 0.5, 0))[order]
+        seconds = grid[a:][c, d][order]
+        counts = np.searchsorted(keys, np.flatnonzero(grid[a] >= 0), side="right")
+        blocks.append(np.stack((np.repeat(firsts, counts), np.concatenate([seconds[:k] for k in counts])), axis=1))
+    return np.concatenate(blocks)
+
+
+def triple_cycles(g01, g12, g02):
+    """
+    the 3s constraints of calc_3constraints of one triple of the N sequences as edge IDs,
+    the third edge X0_e__2_d is the edge between 0e and 2d
+    :param g01: edge IDs of the first and second sequence, g12 and g02 likewise
+    :return: array k x 3
+    """
+    blocks = [np.zeros((0, 3), dtype=np.int64)]
+    e, d = np.nonzero(g02 >= 0)
+    third = g02[e, d]
+    for a in range(g01.shape[0]):
+        b = np.flatnonzero(g01[a] >= 0)
+        for c in range(g12.shape[1]):
+            bc = b[g12[b, c] >= 0]
+            es = third[((d < c - 1) & (e > a)) | ((d > c) & (e < a - 1))]
+            if len(bc) == 0 or len(es) == 0:
+                continue
+            blocks.append(np.stack((np.repeat(g01[a, bc], len(es)), np.repeat(g12[bc, c], len(es)),
+                                    np.tile(es, len(bc))), axis=1))
+    return np.concatenate(blocks)
+
+
+def cycle2_ids(seqs, ids):
+    """
+    the 2s constraints as edge IDs, one block per pair of sequences (see pair_cycles)
+    :return: generator of arrays k x 2
+    """
+    for pair in seq_pairs(seqs):
+        yield pair_cycles(ids[pair])
 
-# set up all edges the graph contains
-es, no_of_es = all_edges(seqs)
-es_as_int = edges_as_int(es)
 
-# write lp to file specified as first argument
-write(obj_fct, cycles, bin_cons, es_as_int, inPath)
-print("Number of constraints:\n2s constraints: {}\n3s constraints: {}\ncombined: {}"
-      .format(no_of_cycles2, no_of_cycles3, no_of_cycles))
+def cycle3_ids(seqs, ids):
+    """
+    the 3s constraints as edge IDs, one block per triple of sequences (see triple_cycles)
+    :return: generator of arrays k x 3
+    """
+    for p, q, r in seq_triples(seqs):
+        yield triple_cycles(ids[p, q], ids[q, r], ids[p, r])
+
+
+_ids = None # edge IDs of a worker process
+
+
+def _init_worker(ids):
+    """sends the edge IDs once per worker process"""
+    global _ids
+    _ids = ids
+
+
+def _cycle_block(key):
+    """constraint block of a pair or triple of sequences in a worker process"""
+    if len(key) == 2:
+        return pair_cycles(_ids[key])
+    p, q, r = key
+    return triple_cycles(_ids[p, q], _ids[q, r], _ids[p, r])
+
+
+def cycle_blocks(seqs, ids, processes=None):
+    """
+    the 2s and 3s constraint blocks of all pairs and triples of sequences,
+    generated on a process pool if processes is given, in the order of cycle2_ids and cycle3_ids
+    :return: list of arrays k x 2 resp. k x 3
+    """
+    if processes is None:
+        return list(cycle2_ids(seqs, ids)) + list(cycle3_ids(seqs, ids))
+    keys = list(seq_pairs(seqs)) + list(seq_triples(seqs))
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(ids,)) as pool:
+        return list(pool.map(_cycle_block, keys))
+
+
+def build_model(seqs, candidates=None, processes=None):
+    """
+    builds objective and mixed cycle constraints directly as CSR matrix with integer variable IDs,
+    a constraint with k edges has the right hand side k - 1
+    :param seqs: list of sequences
+    :param candidates: candidate edges (see edge_mask), only these edges are variables
+    :param processes: constraint blocks are generated on this many processes if set (see cycle_blocks)
+    :return: (edge IDs, objective weights, constraint matrix, right hand side)
+    """
+    ids, count = edge_ids(seqs, candidates)
+    blocks = [block for block in cycle_blocks(seqs, ids, processes) if len(block)]
+    sizes = np.array([block.shape[1] for block in blocks for _ in range(len(block))], dtype=np.int64)
+    indptr = np.concatenate(([0], np.cumsum(sizes)))
+    indices = np.concatenate([block.ravel() for block in blocks]) if blocks else np.zeros(0, dtype=np.int64)
+    matrix = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(sizes), count))
+    return ids, objective_weights(seqs, ids), matrix, sizes - 1.0
+
+
+def solve(seqs, ids, weights, matrix, rhs):
+    """
+    solves the model with scipy.optimize.milp (HiGHS), all edges are binary
+    :return: (objective value, chosen edges as tuples (lidx, i, l2idx, j))
+    """
+    if len(weights) == 0:  # all edges pruned
+        return 0.0, []
+    constraints = [LinearConstraint(matrix, -np.inf, rhs)] if matrix.shape[0] else []
+    result = milp(-weights, constraints=constraints, integrality=np.ones(len(weights)), bounds=Bounds(0, 1))
+    if result.x is None:
+        raise ValueError("MIP could not be solved: " + result.message)
+    chosen = np.append(result.x > 0.5, False)  # ID -1 -> False
+    edges = []
+    for (lidx, l2idx), grid in ids.items():
+        edges += [(lidx, int(i), l2idx, int(j)) for i, j in zip(*np.nonzero(chosen[grid]))]
+    return -result.fun, edges
+
+
+def relax(weights, matrix, rhs):
+    """
+    solves the LP relaxation of the model (edges between 0 and 1)
+    :return: value of every edge ID
+    """
+    if len(weights) == 0:  # all edges pruned
+        return np.zeros(0)
+    constraints = [LinearConstraint(matrix, -np.inf, rhs)] if matrix.shape[0] else []
+    result = milp(-weights, constraints=constraints, integrality=np.zeros(len(weights)), bounds=Bounds(0, 1))
+    if result.x is None:
+        raise ValueError("LP could not be solved: " + result.message)
+    return result.x
+
+
+def decode(seqs, edges):
+    """
+    turns chosen edges into an alignment: connected chars form a column,
+    columns are ordered along the sequences
+    :param edges: tuples (lidx, i, l2idx, j)
+    :return: list of aligned sequences with '-' as gap
+    """
+    parent = {(k, i): (k, i) for k, s in enumerate(seqs) for i in range(len(s))}
+
+    def find(v):
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+
+    for lidx, i, l2idx, j in edges:
+        parent[find((lidx, i))] = find((l2idx, j))
+    columns = {}
+    for v in parent:
+        columns.setdefault(find(v), []).append(v)
+    # column of char i -> column of char i + 1 of the same sequence, ordered by Kahn's algorithm
+    succ = {col: set() for col in columns}
+    for k, s in enumerate(seqs):
+        for i in range(len(s) - 1):
+            if find((k, i)) != find((k, i + 1)):
+                succ[find((k, i))].add(find((k, i + 1)))
+    indegree = {col: 0 for col in columns}
+    for col in succ:
+        for nxt in succ[col]:
+            indegree[nxt] += 1
+    ready = sorted(col for col in columns if indegree[col] == 0)
+    order = []
+    while ready:
+        col = ready.pop(0)
+        order.append(col)
+        for nxt in sorted(succ[col]):
+            indegree[nxt] -= 1
+            if indegree[nxt] == 0:
+                ready.append(nxt)
+    if len(order) != len(columns) or any(len({k for k, _ in columns[col]}) != len(columns[col]) for col in columns):
+        raise ValueError("The chosen edges contain a mixed cycle, they are no alignment.")
+    rows = []
+    for k, s in enumerate(seqs):
+        chars = {find((k, i)): s[i] for i in range(len(s))}
+        rows.append("".join(chars.get(col, "-") for col in order))
+    return rows
+
+
+""" cutting planes: mixed cycle constraints are only added when the solution violates them """
+MAX_ROUNDS = 1000 # solves of the cutting plane loop
+
+
+def edge_id(ids, edge):
+    """
+    variable ID of an edge (lidx, i, l2idx, j), see edge_ids
+    """
+    lidx, i, l2idx, j = edge
+    return int(ids[lidx, l2idx][i, j])
+
+
+def find_mixed_cycles(seqs, edges):
+    """
+    Separation: finds mixed cycles in the chosen edges. The edges join chars to columns, a column with two chars
+    of the same sequence is a cycle, otherwise the columns are ordered along the sequences (arcs from the column
+    of char i to the column of char i + 1) and every back arc of a depth first search closes a cycle.
+    Within a column the cycle follows the edges from the char it enters to the char it leaves.
+    :param edges: tuples (lidx, i, l2idx, j)
+    :return: list of cycles, each a list of edges, empty if the edges are an alignment
+    """
+    adj = {}
+    for edge in edges:
+        lidx, i, l2idx, j = edge
+        adj.setdefault((lidx, i), []).append(((l2idx, j), edge))
+        adj.setdefault((l2idx, j), []).append(((lidx, i), edge))
+    column = {}
+    members = []
+    for start in adj:
+        if start in column:
+            continue
+        column[start] = len(members)
+        members.append([start])
+        queue = deque([start])
+        while queue:
+            for nxt, _ in adj[queue.popleft()]:
+                if nxt not in column:
+                    column[nxt] = column[start]
+                    members[-1].append(nxt)
+                    queue.append(nxt)
+
+    def path(u, v):
+        """edges of a shortest path from u to v within a column"""
+        prev = {u: None}
+        queue = deque([u])
+        while v not in prev:
+            w = queue.popleft()
+            for nxt, edge in adj[w]:
+                if nxt not in prev:
+                    prev[nxt] = (w, edge)
+                    queue.append(nxt)
+        result = []
+        while prev[v] is not None:
+            v, edge = prev[v]
+            result.append(edge)
+        return result
+
+    cycles = []
+    for nodes in members:  # two chars of the same sequence in a column
+        first = {}
+        for k, i in sorted(nodes):
+            if k in first:
+                cycles.append(path(first[k], (k, i)))
+            else:
+                first[k] = (k, i)
+
+    # columns of chars without edges are the chars themselves
+    def col(v):
+        return column.get(v, v)
+
+    succ = {}
+    for k, seq in enumerate(seqs):
+        for i in range(len(seq) - 1):
+            if col((k, i)) != col((k, i + 1)):
+                succ.setdefault(col((k, i)), []).append(((k, i), (k, i + 1)))
+    state = {}  # 1 = on the stack, 2 = done
+    for root in list(succ):
+        if root in state:
+            continue
+        state[root] = 1
+        stack = [(root, iter(succ[root]), None)]  # column, remaining arcs, arc into the column
+        while stack:
+            c, arcs, _ = stack[-1]
+            arc = next(arcs, None)
+            if arc is None:
+                state[c] = 2
+                stack.pop()
+                continue
+            head = col(arc[1])
+            if head not in state:
+                state[head] = 1
+                stack.append((head, iter(succ.get(head, ())), arc))
+            elif state[head] == 1:  # back arc: the columns from head to c on the stack form a cycle
+                k = next(idx for idx, frame in enumerate(stack) if frame[0] == head)
+                arcs_in = [frame[2] for frame in stack[k + 1:]] + [arc]
+                cycle = []
+                for into, out in zip([arc] + arcs_in[:-1], arcs_in):
+                    if into[1] != out[0]:
+                        cycle += path(into[1], out[0])
+                if cycle:
+                    cycles.append(cycle)
+    unique = {}
+    for cycle in cycles:
+        unique.setdefault(frozenset(cycle), cycle)
+    return list(unique.values())
+
+
+def staircase_values(grid):
+    """
+    V(i, j) = x(i, j) + max(V(i-1, j), V(i, j+1)): largest sum of x on a staircase from (0, m-1) to (i, j),
+    one reversed cumulative maximum per row
+    """
+    n, m = grid.shape
+    value = np.empty((n, m))
+    prev = np.zeros(m)
+    for i in range(n):
+        suffix = np.cumsum(grid[i, ::-1])[::-1]  # sum of x(i, j..m-1)
+        shifted = np.append(suffix[1:], 0)
+        value[i] = suffix + np.maximum.accumulate((prev - shifted)[::-1])[::-1]
+        prev = value[i]
+    return value
+
+
+def staircase(value, grid, i, j):
+    """
+    cells of the best staircase from (0, m-1) to (i, j) in reversed order
+    """
+    m = grid.shape[1]
+    cells = [(i, j)]
+    while i > 0 or j < m - 1:
+        if j == m - 1 or (i > 0 and value[i, j] == grid[i, j] + value[i - 1, j]):
+            i -= 1
+        else:
+            j += 1
+        cells.append((i, j))
+    return cells
+
+
+def find_cliques(ids, x):
+    """
+    Separation of pairwise cliques: for two sequences all edges on a staircase from (0, m-1) to (n-1, 0)
+    (i increasing, j decreasing) cross or share a char, so at most one of them is in an alignment.
+    The best staircases through every cell follow from dynamic programming from both corners (staircase_values),
+    the cells are visited from the best sum down and every cell not covered yet gives a staircase.
+    Works for fractional x of the LP relaxation as well, pruned edges count 0 and are left out.
+    :param x: value of every edge ID
+    :return: list of staircases with a sum above 1, each a list of edge IDs
+    """
+    cliques = []
+    for pair in ids.values():
+        n, m = pair.shape
+        grid = np.where(pair >= 0, np.append(x, 0)[pair], 0)
+        if grid.sum() <= 1 + 1e-6:
+            continue
+        head = staircase_values(grid)
+        tail = staircase_values(grid[::-1, ::-1])  # from (n-1, 0) in reversed coordinates
+        through = head + tail[::-1, ::-1] - grid
+        covered = np.zeros((n, m), dtype=bool)
+        for cell in np.argsort(-through, axis=None):
+            i, j = divmod(int(cell), m)
+            if through[i, j] <= 1 + 1e-6:
+                break
+            if covered[i, j] or grid[i, j] <= 1e-6:
+                continue
+            cells = staircase(head, grid, i, j)[::-1]
+            cells += [(n - 1 - a, m - 1 - b) for a, b in staircase(tail, grid[::-1, ::-1], n - 1 - i, m - 1 - j)[1:]]
+            for a, b in cells:
+                covered[a, b] = True
+            cliques.append(sorted(int(pair[a, b]) for a, b in cells if pair[a, b] >= 0))
+    return cliques
+
+
+def cycle_matrix(cycles, count):
+    """
+    constraints given as lists of edge IDs and right hand sides
+    :param cycles: list of tuples (edge IDs, right hand side)
+    :return: (CSR matrix, right hand side)
+    """
+    sizes = np.array([len(c) for c, _ in cycles], dtype=np.int64)
+    indptr = np.concatenate(([0], np.cumsum(sizes)))
+    indices = np.array([e for c, _ in cycles for e in c], dtype=np.int64)
+    matrix = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(cycles), count))
+    return matrix, np.array([rhs for _, rhs in cycles], dtype=np.float64)
+
+
+def solve_lazy(seqs, candidates=None, max_rounds=MAX_ROUNDS):
+    """
+    Cutting plane loop, starts with the objective and binary edges only:
+    1. the LP relaxation is solved and violated pairwise cliques (find_cliques, at most 1) are added until there
+       are none, this is cheap and makes the following MIPs much tighter
+    2. the MIP is solved, the violated mixed cycles of the chosen edges (find_mixed_cycles, the edges of a cycle with
+       k edges sum up to at most k - 1) and cliques are added until there are no mixed cycles,
+       then the edges are the optimal alignment.
+    Works for any number of sequences, with candidates only between the candidate edges.
+    :return: (objective value, chosen edges, dict with rounds, LP rounds, constraints, separation and solving time in s)
+    """
+    ids, count = edge_ids(seqs, candidates)
+    weights = objective_weights(seqs, ids)
+    rows = {}
+    stats = {"rounds": 0, "lp rounds": 0, "constraints": 0, "separation": 0.0, "solving": 0.0}
+    integral = False
+    while stats["rounds"] < max_rounds:
+        start_time = time.time()
+        matrix, rhs = cycle_matrix(list(rows.values()), count)
+        if integral:
+            value, edges = solve(seqs, ids, weights, matrix, rhs)
+            x = np.zeros(count)
+            x[[edge_id(ids, e) for e in edges]] = 1
+        else:
+            x = relax(weights, matrix, rhs)
+        sep_time = time.time()
+        found = []
+        if integral:
+            cycles = find_mixed_cycles(seqs, edges)
+            found = [(sorted(edge_id(ids, e) for e in cycle), len(cycle) - 1) for cycle in cycles]
+        if found or not integral:
+            found += [(stair, 1) for stair in find_cliques(ids, x)]
+        stats["rounds" if integral else "lp rounds"] += 1
+        stats["solving"] += sep_time - start_time
+        stats["separation"] += time.time() - sep_time
+        new = {tuple(c): (c, rhs) for c, rhs in found if tuple(c) not in rows}
+        if not new:
+            if integral and not found:
+                stats["constraints"] = len(rows)
+                return value, edges, stats
+            if integral:
+                raise ValueError("Separation found only constraints that are already in the model.")
+            integral = True
+        rows.update(new)
+    raise ValueError("No alignment after {} rounds of the cutting plane loop.".format(max_rounds))
+
+
+""" free MPS output: variables x<ID>, constraints c<row>, the IDs are listed in a mapping table """
+def open_output(file_path):
+    """
+    opens an output file for writing text, gzip compressed if the path ends with .gz
+    :return: file object
+    """
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, "wt", compresslevel=GZIP_LEVEL)
+    return open(file_path, "w", buffering=BUFFER_SIZE)
+
+
+def pairs_per_line(head, entries):
+    """
+    MPS data lines: head followed by at most two "name value" entries per line
+    :param entries: sequence of str
+    :return: list of lines
+    """
+    lines = [" ".join((head, first, second)) for first, second in zip(entries[0::2], entries[1::2])]
+    if len(entries) % 2:
+        lines.append(" ".join((head, entries[-1])))
+    return lines
+
+
+def mps_entries(names, values):
+    """
+    MPS entries "name value", every distinct value is formatted only once
+    :param names: object array of str
+    :return: object array of str
+    """
+    distinct, codes = np.unique(values, return_inverse=True)
+    return names + np.array([" {:g}".format(v) for v in distinct], dtype=object)[codes]
+
+
+def mps_lines(weights, matrix, rhs):
+    """
+    the model as free MPS: maximize weights * x subject to matrix * x <= rhs, x binary
+    :return: generator of lines
+    """
+    yield "NAME msa"
+    yield "OBJSENSE"
+    yield "    MAX"
+    yield "ROWS"
+    yield " N obj"
+    rows = np.array(["c{}".format(r) for r in range(matrix.shape[0])], dtype=object)
+    for r in range(matrix.shape[0]):
+        yield " L " + rows[r]
+    yield "COLUMNS"
+    columns = matrix.tocsc()
+    entries = mps_entries(rows[columns.indices], columns.data)
+    for j in range(len(weights)):
+        column = ["obj {:g}".format(weights[j])] + entries[columns.indptr[j]:columns.indptr[j + 1]].tolist()
+        yield from pairs_per_line(" x{}".format(j), column)
+    yield "RHS"
+    yield from pairs_per_line(" rhs", mps_entries(rows, rhs).tolist())
+    yield "BOUNDS"
+    for j in range(len(weights)):
+        yield " BV bnd x{}".format(j)
+    yield "ENDATA"
+
+
+def write_mps(file_path, weights, matrix, rhs):
+    """
+    writes the model as free MPS file, gzip compressed if the path ends with .gz,
+    the lines are joined to blocks of LINES_PER_WRITE before they are written
+    :return: number of lines
+    """
+    lines = mps_lines(weights, matrix, rhs)
+    count = 0
+    with open_output(file_path) as f:
+        while True:
+            block = list(islice(lines, LINES_PER_WRITE))
+            if not block:
+                return count
+            f.write("\n".join(block))
+            f.write("\n")
+            count += len(block)
+
+
+def write_mapping(file_path, names, seqs, ids, weights):
+    """
+    writes the variable IDs as tab separated table: ID, name, position (0-based) and char of both sequences, weight
+    :param names: names of the sequences
+    :return: number of variables
+    """
+    with open_output(file_path) as f:
+        f.write("id\tseq1\tpos1\tchar1\tseq2\tpos2\tchar2\tweight\n")
+        count = 0
+        for (lidx, l2idx), grid in ids.items():
+            for i, j in zip(*np.nonzero(grid >= 0)):  # row major = order of the IDs
+                edge = grid[i, j]
+                f.write("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{:g}\n".format(edge, names[lidx], i, seqs[lidx][i],
+                                                                   names[l2idx], j, seqs[l2idx][j], weights[edge]))
+                count += 1
+    return count
+
+
+def main():
+    # creating parser for out file specification -> in.lp, in.mps or in.mps.gz
+    parser = argparse.ArgumentParser(description="Creates the ILP of the multiple alignment of N sequences, the three "
+                                                 "example sequences or all sequences of a fasta file, as .lp file "
+                                                 "(solve with lp_solve /file/path/to/in.lp from directory of "
+                                                 "lp_solve) or as free MPS file (.mps, gzip compressed: .mps.gz) "
+                                                 "with a table of the variable IDs.")
+    parser.add_argument("Path",
+                        metavar="path",
+                        type=str,
+                        nargs="?",
+                        help="Output path of lp file (.lp) or free MPS file (.mps, gzip compressed: .mps.gz).",
+                        default=None)
+    parser.add_argument("--fasta",
+                        type=str,
+                        help="Align all sequences of this fasta file instead of the three example sequences.",
+                        default=None)
+    parser.add_argument("--mapping",
+                        type=str,
+                        help="Output path of the table of the variable IDs of the MPS file. "
+                             "Default: path of the MPS file with .tsv instead of .mps",
+                        default=None)
+    parser.add_argument("--processes",
+                        type=int,
+                        help="Generate the constraints of the pairs and triples of sequences on this many processes.",
+                        default=None)
+    parser.add_argument("--solve",
+                        action="store_true",
+                        help="Build the model in memory as sparse matrix and solve it with scipy (HiGHS).")
+    parser.add_argument("--lazy",
+                        action="store_true",
+                        help="Solve with a cutting plane loop that only adds the violated mixed cycles.")
+    parser.add_argument("--band",
+                        type=int,
+                        help="Only edges within this distance of the diagonal of two sequences.",
+                        default=None)
+    parser.add_argument("--kmer",
+                        type=int,
+                        help="Only edges within K of a k-mer shared by both sequences.",
+                        default=None)
+    parser.add_argument("--nw",
+                        type=int,
+                        help="Only edges within this distance of the optimal pairwise alignment.",
+                        default=None)
+    args = parser.parse_args()
+
+    if args.fasta is not None:
+        heads, seqs = fasta.read(args.fasta)
+        names = [(head.lstrip(">").split() or ["seq{}".format(k)])[0] for k, head in enumerate(heads)]
+    else:
+        seqs, names = EXAMPLE_SEQS, ["s1", "s2", "s3"]
+
+    candidates = candidate_edges(seqs, args.band, args.kmer, args.nw)
+    if candidates is not None:
+        total = sum(len(seqs[lidx]) * len(seqs[l2idx]) for lidx, l2idx in seq_pairs(seqs))
+        print("{} of {} edges are candidates.".format(sum(int(c.sum()) for c in candidates.values()), total))
+
+    # write MPS and the table of the variable IDs
+    if args.Path is not None and args.Path.endswith((".mps", ".mps.gz")):
+        start_time = time.time()
+        ids, weights, matrix, rhs = build_model(seqs, candidates, args.processes)
+        model_time = time.time()
+        write_mps(args.Path, weights, matrix, rhs)
+        mapping = args.mapping or args.Path[:args.Path.rindex(".mps")] + ".tsv"
+        write_mapping(mapping, names, seqs, ids, weights)
+        print("{} and {}\n successfully written.".format(args.Path, mapping))
+        print("{} variables, {} constraints\nmodel generation: {:.3f} s, writing: {:.3f} s"
+              .format(matrix.shape[1], matrix.shape[0], model_time - start_time, time.time() - model_time))
+
+    # write lp to file specified as first argument, constraints are streamed while they are generated
+    elif args.Path is not None or not (args.solve or args.lazy):
+        start_time = time.time()
+        counts = write(seqs, args.Path, candidates)
+        if counts is not None:
+            print("Number of constraints:\n2s constraints: {}\n3s constraints: {}\ncombined: {}"
+                  .format(counts[0], counts[1], sum(counts)))
+            print("Writing the lp file needed {:.3f} s.".format(time.time() - start_time))
+
+    if args.solve:
+        start_time = time.time()
+        ids, weights, matrix, rhs = build_model(seqs, candidates, args.processes)
+        model_time = time.time()
+        value, edges = solve(seqs, ids, weights, matrix, rhs)
+        solve_time = time.time()
+        print("Value of objective function: {}".format(value))
+        try:
+            print("\n".join(decode(seqs, edges)))
+        except ValueError as e:
+            print(e)
+        print("{} variables, {} constraints\nmodel generation: {:.3f} s, solving: {:.3f} s"
+              .format(matrix.shape[1], matrix.shape[0], model_time - start_time, solve_time - model_time))
+
+    if args.lazy:
+        value, edges, stats = solve_lazy(seqs, candidates)
+        print("Value of objective function: {}".format(value))
+        print("\n".join(decode(seqs, edges)))
+        print("{} LP rounds, {} MIP rounds, {} mixed cycle and clique constraints\nseparation: {:.3f} s, solving: {:.3f} s"
+              .format(stats["lp rounds"], stats["rounds"], stats["constraints"], stats["separation"], stats["solving"]))
+
+
+if __name__ == "__main__":
+    main()
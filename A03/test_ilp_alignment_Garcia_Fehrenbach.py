@@ -0,0 +1,74 @@
+import re
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import milp, LinearConstraint, Bounds
+
+import ilp_alignment_Garcia_Fehrenbach as ilp
+
+
+def solve_lp_file(path):
+    """
+    parses an .lp file written by ilp.write and solves it with scipy.optimize.milp
+    :return: (objective value, variables used in the constraints, declared int variables)
+    """
+    with open(path) as f:
+        objective, rest = f.read().split(";", 1)
+    body, declared = rest.rsplit("int ", 1)
+    declared = [name.strip() for name in declared.rstrip("; \n").split(",")]
+    index = {name: k for k, name in enumerate(declared)}
+    weights = np.zeros(len(declared))
+    for weight, name in re.findall(r"(\d+)\*(\w+)", objective):
+        weights[index[name]] = float(weight)
+    rows, cols, rhs, used = [], [], [], set()
+    for line in body.split(";"):
+        if "<" not in line:
+            continue
+        lhs, bound = line.split("<")
+        names = [name.strip() for name in lhs.split("+")]
+        used.update(names)
+        rows += [len(rhs)] * len(names)
+        cols += [index.get(name, -1) for name in names]
+        rhs.append(float(bound))
+    if -1 in cols:  # variable that is not declared
+        return None, used, set(declared)
+    matrix = sparse.csr_matrix((np.ones(len(cols)), (rows, cols)), shape=(len(rhs), len(declared)))
+    result = milp(-weights, constraints=[LinearConstraint(matrix, -np.inf, rhs)],
+                  integrality=np.ones(len(declared)), bounds=Bounds(0, 1))
+    return -result.fun, used, set(declared)
+
+
+def check_same_optimum(seqs, path, candidates=None):
+    ilp.write(seqs, str(path), candidates)
+    value, used, declared = solve_lp_file(str(path))
+    assert used <= declared
+    assert value == ilp.solve(seqs, *ilp.build_model(seqs, candidates))[0]
+
+
+def test_example_lp_matches_sparse_model(tmp_path):
+    check_same_optimum(ilp.EXAMPLE_SEQS, tmp_path / "example.lp")
+
+
+def test_banded_lp_matches_sparse_model(tmp_path):
+    seqs = ["ACGTTGCA", "ACTTGGCA", "AGTTGCCA"]
+    check_same_optimum(seqs, tmp_path / "banded.lp", ilp.candidate_edges(seqs, band=2))
+
+
+def test_lp_constraints_match_sparse_model(tmp_path):
+    seqs = ["GATTACA", "GCATGC", "TACAGAT"]
+    path = str(tmp_path / "rows.lp")
+    ilp.write(seqs, path)
+    with open(path) as f:
+        body, declared = f.read().split(";", 1)[1].rsplit("int ", 1)
+    index = {name.strip(): k for k, name in enumerate(declared.rstrip("; \n").split(","))}  # order of edge_ids
+    lp_rows = {frozenset(index[name.strip()] for name in line.split("<")[0].split("+"))
+               for line in body.split(";") if "<" in line and "+" in line}
+    _, _, matrix, _ = ilp.build_model(seqs)
+    assert lp_rows == {frozenset(matrix.indices[matrix.indptr[k]:matrix.indptr[k + 1]].tolist())
+                       for k in range(matrix.shape[0])}
+
+
+def test_lp_names_are_unique_for_many_long_sequences():
+    seqs = ["ACGTACGTACGT", "CGTACGTACGTA", "GTACGTACGTAC", "TACGTACGTACG"] * 3
+    names = list(ilp.all_edges(seqs, ilp.candidate_edges(seqs, band=12)))
+    assert len(set(names)) == len(names) == ilp.edge_ids(seqs)[1]
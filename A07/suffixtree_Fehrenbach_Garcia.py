@@ -1,5 +1,7 @@
 import argparse
 
+from packed_seq import PackedSequence
+
 
 class Node:
     """
@@ -75,9 +77,12 @@ class SuffixTree:
     def compute_tree(self, text):
         """
         Computes a suffix tree from a text.
-        :param text: String from which the suff tree is computed
+        A PackedSequence is unpacked once, building on its views is much slower than on a str.
+        :param text: String or PackedSequence from which the suff tree is computed
         :return: Suffixtree based on its root
         """
+        if isinstance(text, PackedSequence):
+            text = str(text)
         if text[-1:] != "$":
             text += "$"
 
@@ -253,6 +258,10 @@ def main():
                         nargs="+",
                         type=str,
                         help="Multiple queries to search for in the suffix tree.")
+    parser.add_argument("-P",
+                        action="store_true",
+                        help="If set reads the text 2-bit packed, it is unpacked once before the tree is built.",
+                        default=False)
     parser.add_argument("-T",
                         action="store_true",
                         help="If set prints the suffix tree to console in a very basic manner.",
@@ -263,7 +272,7 @@ def main():
     print_tree = args.T
 
     tree = SuffixTree()
-    tree.compute_tree(text)
+    tree.compute_tree(PackedSequence.from_str(text) if args.P else text)
     print("text: " + text)
     if print_tree:
         tree.print_suffix_tree()
@@ -1,26 +1,136 @@
 """ FastA file handler
-    :functions: read(path)"""
+    :functions: read(path), iter_records(path)"""
+import gzip
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+BLOCK_SIZE = 1 << 22 # read files in blocks of 4 MiB
+WHITESPACE = b" \t\r\n"
+GZIP_MAGIC = b"\x1f\x8b\x08"
+
+
+def compression(path):
+    """detects the compression of a file by its magic bytes
+        :returns: "bgzf", "gzip" or None for plain files"""
+    with open(path, 'rb') as f:
+        head = f.read(18)
+    if not head.startswith(GZIP_MAGIC):
+        return None
+    # BGZF: FEXTRA flag set and extra subfield 'BC' with the block size
+    if head[3] & 4 and len(head) == 18 and head[12:14] == b"BC":
+        return "bgzf"
+    return "gzip"
+
+
+def iter_blocks(path, block_size=BLOCK_SIZE, threads=None):
+    """reads a plain, gzip or bgzip compressed file in blocks of about block_size bytes
+        gzip is decompressed streaming, BGZF blocks are decompressed in parallel on a thread pool
+        :returns: generator of bytes, ends with an empty block"""
+    kind = compression(path)
+    if kind == "bgzf":
+        yield from _iter_bgzf_blocks(path, block_size, threads or os.cpu_count() or 1)
+    else:
+        with (gzip.open(path, 'rb') if kind == "gzip" else open(path, 'rb')) as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                yield block
+    yield b""
+
+
+def _inflate_bgzf(raw):
+    """decompresses the deflate data of one BGZF block and checks its CRC32 and size"""
+    xlen = struct.unpack_from("<H", raw, 10)[0]
+    crc, size = struct.unpack_from("<II", raw, len(raw) - 8)
+    data = zlib.decompress(raw[12 + xlen:-8], -15)
+    if len(data) != size or zlib.crc32(data) != crc:
+        raise ValueError("Corrupt BGZF block.")
+    return data
+
+
+def _iter_bgzf_blocks(path, block_size, threads):
+    """reads BGZF blocks, decompresses them on a thread pool (zlib releases the GIL)
+        and yields the data in file order joined to about block_size bytes"""
+    pending = deque()
+    out = []
+    out_size = 0
+    with open(path, 'rb') as f, ThreadPoolExecutor(threads) as pool:
+        while True:
+            header = f.read(18)
+            if header:
+                if len(header) < 18 or not header.startswith(GZIP_MAGIC) or header[12:14] != b"BC":
+                    raise ValueError("Truncated or invalid BGZF block in {}.".format(path))
+                bsize = struct.unpack_from("<H", header, 16)[0] + 1 # total block size
+                pending.append(pool.submit(_inflate_bgzf, header + f.read(bsize - 18)))
+            # collect finished blocks in order, keep about 4 blocks per thread in flight
+            while pending and (not header or len(pending) > 4 * threads or pending[0].done()):
+                data = pending.popleft().result()
+                out.append(data)
+                out_size += len(data)
+                if out_size >= block_size:
+                    yield b"".join(out)
+                    out, out_size = [], 0
+            if not header:
+                break
+    if out:
+        yield b"".join(out)
+
+
+def iter_records(path, block_size=BLOCK_SIZE):
+    """reads in fasta file record by record
+        the file is read in binary blocks, the sequence of a record is collected in chunks
+        and joined once -> memory is bounded by the largest record
+        gzip and bgzip compressed files are detected and decompressed on the fly
+        :returns: generator of tuples (header, sequence)"""
+    head = None # header of the current record
+    chunks = [] # sequence chunks of the current record
+    buf = b"\n" # unprocessed data, starts with a line break so a '>' at the beginning is found as header
+    for block in iter_blocks(path, block_size):
+        buf += block
+        pos = 0
+        keep = len(buf) - 1 # the last byte may be the line break in front of a header
+        while True:
+            i = buf.find(b"\n>", pos) # start of next header
+            if i == -1:
+                break
+            j = buf.find(b"\n", i + 1) # end of header line
+            if j == -1:
+                if block: # header line is cut off -> read more
+                    keep = i
+                    break
+                j = len(buf)
+            chunks.append(buf[pos:i])
+            if head is not None or any(chunks): # yield previous record
+                yield _record(head, chunks)
+            head = buf[i + 1:j]
+            chunks = []
+            pos = j
+        if not block: # end of file
+            chunks.append(buf[pos:])
+            break
+        keep = max(keep, pos)
+        chunks.append(buf[pos:keep])
+        buf = buf[keep:]
+    if head is not None or any(chunks): # yield last record
+        yield _record(head, chunks)
+
+
+def _record(head, chunks):
+    """builds a (header, sequence) tuple from a header line and the sequence chunks of one record"""
+    head = head.rstrip().decode() if head is not None else ""
+    return head, b"".join(chunks).translate(None, WHITESPACE).decode("latin-1")
+
 
 def read(path):
-    """reads in fasta file"""
+    """reads in fasta file
+        :returns: (list of headers, list of sequences)"""
     heads = []
-    head = ""
     seqs = []
-    seq = ""
-    with open(path, 'r') as f:
-        for line in f:
-            line = line.rstrip()
-            if line.startswith(">"):
-                if seq != "": # append seq + head to their lists
-                    seqs.append(seq)
-                    heads.append(head)
-                    seq = ""
-                head = line # save current line to head if it startswith >
-            else:
-                seq += line # add current line to seq -> necessary to read in each sequence line
-        seqs.append(seq) # add last seq to seqs array
-        heads.append(head) # add last header to heads array
-        data = [(heads[i], seqs[i]) for i in range(0, len(heads))] # combine to data
-
-    f.close()
+    for head, seq in iter_records(path):
+        heads.append(head)
+        seqs.append(seq)
     return heads, seqs
@@ -4,7 +4,10 @@ from datetime import datetime
 import os.path
 import mmh3 # hash function
 import bisect
+from itertools import chain
+import numpy as np
 import fasta
+from packed_seq import PackedSequence, pack_records
 
 
 class Mash:
@@ -20,29 +23,59 @@ class Mash:
         :param input: list of sequences
         :return: list of all kmers of the genome
         """
-        kmer_list = []  # list for all kmers of file
+        return list(self.iter_kmers(k, input))
+
+    def iter_kmers(self, k: int, input):
+        """
+        Creates kmers of size k lazily from an iterable of contigs of a genome, e.g. a fasta.iter_records generator.
+        Only one contig is held in memory at a time.
+        :param k: size of kmer
+        :param input: iterable of sequences
+        :return: generator of all kmers of the genome
+        """
         for seq in input:  # for sequence in input file
-            kmers = []
             for i in range(len(seq) - k + 1):  # create kmers
-                kmer = seq[i:i + k]  # each kmer ranges from i to i+k
-                kmers.append(kmer)  # kmers for each contig
-            kmer_list.extend(kmers)  # kmers for whole genome
-        return kmer_list
+                yield seq[i:i + k]  # each kmer ranges from i to i+k
+
+    def hash_kmer_codes(self, codes: np.ndarray, seed: int = 100):
+        """
+        Hashes 2-bit encoded kmers with the 64 bit finalizer of MurmurHash3, vectorised.
+        The hashes differ from mmh3.hash64 of the kmer strings -> only compare sketches calculated the same way.
+        :param codes: uint64 array of kmer codes
+        :param seed: seed mixed into each code
+        :return: int64 array of hashes
+        """
+        h = codes ^ np.uint64(seed)
+        h ^= h >> np.uint64(33)
+        h *= np.uint64(0xff51afd7ed558ccd)
+        h ^= h >> np.uint64(33)
+        h *= np.uint64(0xc4ceb9fe1a85ec53)
+        h ^= h >> np.uint64(33)
+        return h.view(np.int64)
 
     def calc_sketch(self, k: int, s: int, input: []):
         """
         Calculates sketches of given input sequence input with k-mer size k and sketch size s.
         :param k: k-mer size
         :param s: sketch size
-        :param input: input sequence
+        :param input: iterable of input sequences
         :return: sorted list q of sketches -> descending order
         """
         q = sorted([]) # empty sorted list
-        # create kmers
-        kmer_list = self.create_kmers(k, input) # list for all kmers of file
 
-        # create sketches
-        for kmer in kmer_list: # go through kmers in list
+        # PackedSequence contigs -> vectorised kmer codes & hashes, keep the s smallest unique hashes per contig
+        input = iter(input)
+        first = next(input, None)
+        input = chain([first], input) if first is not None else input
+        if isinstance(first, PackedSequence):
+            q = np.empty(0, dtype=np.int64)
+            for seq in input:
+                hashes = np.unique(self.hash_kmer_codes(seq.kmer_codes(k)))[:s]
+                q = np.union1d(q, hashes)[:s]
+            return q.tolist()
+
+        # create kmers lazily & sketches
+        for kmer in self.iter_kmers(k, input): # go through kmers of file
             h = mmh3.hash64(kmer, 100) # hash current kmer, default seed is 0, seed 100 seems fine????
             if not q: # if q is empty -> append the hash
                 q.append(h)
@@ -123,6 +156,9 @@ def main():
                         type=int,
                         help="Specify sketch size. Default = 1000.",
                         default=1000)
+    parser.add_argument("-p", "--packed",
+                        action="store_true",
+                        help="Store contigs 2-bit packed and hash kmer codes vectorised instead of kmer strings.")
     parser.add_argument("input_files",
                         type=str,
                         nargs="+",
@@ -136,12 +172,8 @@ def main():
 
     # handle fasta files
     filenames = []
-    head_list = []
-    seq_list = []
     for idx in range(len(input)):
         filenames.append(os.path.basename(input[idx]))
-        head_list.append(fasta.read(input[idx])[0])
-        seq_list.append(fasta.read(input[idx])[1])
 
     # check number of k-mers L - k+1
     # for debugging
@@ -167,8 +199,12 @@ def main():
     print("Calculating sketches. This may take a while ...")
     print(datetime.now())
     sketches = []
-    for seq in seq_list: # seq is a list of contigs per file -> whole genome in contigs
-        sketch = mash.calc_sketch(k=k, s=s, input=seq)  # calc sketch per file, sketch is list of s hashes
+    for path in input: # each file is a genome in contigs, contigs are streamed from the file one at a time
+        records = fasta.iter_records(path)
+        if args.packed:
+            records = pack_records(records)
+        seqs = (seq for head, seq in records)
+        sketch = mash.calc_sketch(k=k, s=s, input=seqs)  # calc sketch per file, sketch is list of s hashes
         sketches.append(sketch) # append sketch per file to list sketches
     print(datetime.now())
 